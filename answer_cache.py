@@ -0,0 +1,113 @@
+import re
+import time
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_question(text):
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip("?.! ")
+
+
+def make_cache_key(question, image=None):
+    key = normalize_question(question)
+    if image:
+        key += "|" + hashlib.sha256(image.encode("utf-8")).hexdigest()
+    return key
+
+
+# -------------------- LRU/TTL Answer Cache --------------------
+class AnswerCache:
+    def __init__(self, max_size=1024, ttl=6 * 3600, similarity_threshold=0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = {"exact": 0, "semantic": 0}
+        self.reset()
+
+    def reset(self, version=None):
+        # key -> (answer, slot or None, stored_at); most recently used last
+        self.entries = OrderedDict()
+        # Question embeddings live in fixed slots of one matrix so a lookup is a single dot product
+        self.matrix = None
+        self.slot_keys = [None] * self.max_size
+        # When each slot's answer was stored (NaN for a free slot), so expired slots are masked in one pass
+        self.slot_stored_at = np.full(self.max_size, np.nan)
+        self.free_slots = list(range(self.max_size - 1, -1, -1))
+        self.version = version
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.monotonic() - stored_at > self.ttl
+
+    def _remove(self, key):
+        _, slot, _ = self.entries.pop(key)
+        if slot is not None:
+            self.slot_keys[slot] = None
+            self.slot_stored_at[slot] = np.nan
+            self.free_slots.append(slot)
+
+    def _touch(self, key):
+        answer, _, stored_at = self.entries[key]
+        if self._expired(stored_at):
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return answer
+
+    def get(self, key):
+        answer = self._touch(key) if key in self.entries else None
+        if answer is not None:
+            self.hits["exact"] += 1
+        else:
+            self.misses["exact"] += 1
+        return answer
+
+    def get_similar(self, embedding):
+        if self.matrix is None or len(self.free_slots) == self.max_size:
+            self.misses["semantic"] += 1
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        # Expired slots are purged before scoring, so they can't hide a fresher near-duplicate
+        age = time.monotonic() - self.slot_stored_at
+        if self.ttl is not None:
+            for slot in np.flatnonzero(age > self.ttl):
+                self._remove(self.slot_keys[slot])
+        scores = self.matrix @ query
+        scores[np.isnan(self.slot_stored_at)] = -np.inf
+
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            answer = self._touch(self.slot_keys[best])
+            if answer is not None:
+                self.hits["semantic"] += 1
+                return answer
+        self.misses["semantic"] += 1
+        return None
+
+    def put(self, key, answer, embedding=None):
+        if self.max_size <= 0:
+            return
+        if key in self.entries:
+            self._remove(key)
+        while len(self.entries) >= self.max_size:
+            self._remove(next(iter(self.entries)))
+
+        slot = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            if self.matrix is None:
+                self.matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            slot = self.free_slots.pop()
+            self.matrix[slot] = vector / np.linalg.norm(vector)
+            self.slot_keys[slot] = key
+        stored_at = time.monotonic()
+        if slot is not None:
+            self.slot_stored_at[slot] = stored_at
+        self.entries[key] = (answer, slot, stored_at)
@@ -0,0 +1,79 @@
+import json
+import re
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# -------------------- Incremental JSON Answer Extraction --------------------
+class JSONAnswerStream:
+    # Pulls the text of one string field (e.g. "answer") out of a JSON reply while the
+    # model is still generating it. Text that could still turn out to be the "error"
+    # sentinel is held back until it can't be.
+    def __init__(self, field="answer", sentinel="error"):
+        self.field_pattern = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self.sentinel = sentinel
+        self.buffer = ""
+        self.position = None
+        self.decoded = ""
+        self.emitted = 0
+        self.closed = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.position is None:
+            match = self.field_pattern.search(self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+        self._decode()
+
+        answer = self.decoded.strip().lower()
+        if self.closed and answer == self.sentinel:
+            return ""
+        if not self.closed and self.sentinel.startswith(answer):
+            return ""
+        text = self.decoded[self.emitted:]
+        self.emitted = len(self.decoded)
+        return text
+
+    def _decode(self):
+        buffer, i = self.buffer, self.position
+        while i < len(buffer) and not self.closed:
+            char = buffer[i]
+            if char == '"':
+                self.closed = True
+                i += 1
+            elif char == "\\":
+                if i + 1 >= len(buffer):
+                    break
+                code = buffer[i + 1]
+                if code == "u":
+                    if i + 6 > len(buffer):
+                        break
+                    unit = int(buffer[i + 2:i + 6], 16)
+                    if 0xD800 <= unit <= 0xDBFF:
+                        # A character outside the BMP (e.g. an emoji) comes as a surrogate pair: hold the high
+                        # half back until the low one arrives, since a lone surrogate can't be encoded as UTF-8
+                        low = buffer[i + 6:i + 12]
+                        if len(low) < 6 and "\\u".startswith(low[:2]):
+                            break
+                        if low[:2] == "\\u" and 0xDC00 <= int(low[2:], 16) <= 0xDFFF:
+                            self.decoded += chr(0x10000 + ((unit - 0xD800) << 10) + (int(low[2:], 16) - 0xDC00))
+                            i += 12
+                            continue
+                        unit = 0xFFFD
+                    elif 0xDC00 <= unit <= 0xDFFF:
+                        unit = 0xFFFD
+                    self.decoded += chr(unit)
+                    i += 6
+                else:
+                    self.decoded += ESCAPES.get(code, code)
+                    i += 2
+            else:
+                self.decoded += char
+                i += 1
+        self.position = i
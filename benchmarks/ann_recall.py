@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from retrieval import build_backend, normalize_rows, hnswlib
+from embedding_store import load_embedding_store
+
+SHIPPED_STORES = {
+    "discourse": "discourse_content/cache/question_embeddings",
+    "course": "course_content/cache/tds_question_embeddings",
+}
+
+
+def load_corpora(synthetic_sizes, dim):
+    corpora = {}
+    for name, store_path in SHIPPED_STORES.items():
+        matrix, _ = load_embedding_store(os.path.join(ROOT, store_path))
+        if matrix is None:
+            print(f"[INFO] No {name} embedding store at {store_path}, skipping")
+            continue
+        corpora[name] = np.asarray(matrix, dtype=np.float32)
+
+    # Clustered vectors stand in for many terms' worth of forum threads and course pages
+    rng = np.random.default_rng(0)
+    for n in synthetic_sizes:
+        centers = rng.standard_normal((max(1, n // 200), dim)).astype(np.float32)
+        rows = centers[rng.integers(0, len(centers), n)] + rng.standard_normal((n, dim)).astype(np.float32) * 0.6
+        corpora[f"synthetic-{n}"] = normalize_rows(rows)
+    return corpora
+
+
+def make_queries(matrix, count, noise, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = matrix[rng.integers(0, len(matrix), count)]
+    return normalize_rows(picks + rng.standard_normal(picks.shape).astype(np.float32) * noise / np.sqrt(matrix.shape[1]))
+
+
+def evaluate(backend, queries, truth, top_n):
+    hits, elapsed = 0, 0.0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found, _ = backend.search(query, top_n, -1.0)
+        elapsed += time.perf_counter() - start
+        hits += len(set(found.tolist()) & expected)
+    return hits / (len(queries) * top_n), elapsed / len(queries) * 1000
+
+
+def report(corpora, configs, top_n, query_count, noise):
+    print(f"{'corpus':>18} {'rows':>7} {'backend':>28} {'build (s)':>10} {'query (ms)':>11} {f'recall@{top_n}':>10}")
+    for name, matrix in corpora.items():
+        queries = make_queries(matrix, query_count, noise)
+        exact = build_backend("brute", matrix)
+        truth = [set(exact.search(q, top_n, -1.0)[0].tolist()) for q in queries]
+        for label, backend_name, params in configs:
+            if backend_name == "hnsw" and hnswlib is None:
+                continue
+            start = time.perf_counter()
+            backend = build_backend(backend_name, matrix, **params)
+            build_time = time.perf_counter() - start
+            recall, latency = evaluate(backend, queries, truth, top_n)
+            print(f"{name:>18} {len(matrix):>7} {label:>28} {build_time:>10.2f} {latency:>11.3f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare approximate index backends against exact search.")
+    parser.add_argument("--synthetic", type=int, nargs="*", default=[20000, 100000],
+                        help="sizes of extra clustered synthetic corpora to index")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="query perturbation relative to a corpus row")
+    args = parser.parse_args()
+
+    configs = [("brute", "brute", {})]
+    for nprobe in (1, 4, 8, 16):
+        configs.append((f"ivf nprobe={nprobe}", "ivf", {"nprobe": nprobe}))
+    for ef_search in (16, 64):
+        configs.append((f"hnsw M=16 ef={ef_search}", "hnsw", {"m": 16, "ef_construction": 200, "ef_search": ef_search}))
+    report(load_corpora(args.synthetic, args.dim), configs, args.top_n, args.queries, args.noise)
@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import tempfile
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS_PATH = os.path.join(ROOT, "discourse_content/cache/filtered_posts/discourse_filtered.json")
+# Corpora the API server indexes at startup; copied into a scratch directory so the embedding stores
+# it builds from the mock proxy's vectors never overwrite the real ones
+DATA_DIRS = [
+    "discourse_content/cache/filtered_posts",
+    "course_content/cache/raw_data",
+    "course_content/cache/filtered_data",
+]
+LOG_RE = re.compile(r"\[INFO\] request=(\S+) .*?answer=(\S+) total=([\d.]+)ms(.*)")
+SPAN_RE = re.compile(r"(\w+)=([\d.]+)ms")
+
+
+# -------------------- Processes --------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before it was ready")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} was not ready after {timeout}s")
+
+
+def start_mock_proxy(port, args=None):
+    # Without args: no latency and no injected errors, for building the indexes
+    command = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_proxy.py"), "--port", str(port)]
+    if args is None:
+        command += ["--embedding-latency-ms", "0", "--chat-latency-ms", "0"]
+    else:
+        command += [
+            "--embedding-latency-ms", str(args.embedding_latency_ms), "--chat-latency-ms", str(args.chat_latency_ms),
+            "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+            "--error-status", str(args.error_status), "--reject-rate", str(args.reject_rate), "--seed", str(args.seed),
+        ]
+    process = subprocess.Popen(command)
+    wait_for(f"http://127.0.0.1:{port}/", process, 30)
+    return process
+
+
+def make_workspace():
+    workspace = tempfile.mkdtemp(prefix="tds-bench-")
+    for relative in DATA_DIRS:
+        shutil.copytree(os.path.join(ROOT, relative), os.path.join(workspace, relative), copy_function=shutil.copy2)
+    return workspace
+
+
+def server_env(proxy_port, args):
+    env = dict(os.environ)
+    env.update({
+        "PROXY_BASE_URL": f"http://127.0.0.1:{proxy_port}",
+        "OPENAI_API_KEY": "benchmark",
+        "EMBEDDING_BACKEND": "remote",
+        "ANSWER_CACHE_SIZE": os.environ.get("ANSWER_CACHE_SIZE", "1024") if args.answer_cache else "0",
+        "ANSWER_MODE": args.answer_mode,
+        # The replayed questions are verbatim forum records, so nearly all of them are decisive lexical
+        # matches: unless asked for, every question is embedded the way unseen traffic would be
+        "LEXICAL_SKIP_EMBEDDING": "1" if args.lexical_skip else "0",
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def build_indexes(workspace, args):
+    # Embed the corpora once, from a proxy with no latency or errors, before several workers
+    # would each try to build the same stores
+    port = free_port()
+    proxy = start_mock_proxy(port)
+    code = (
+        "from discourse_content.process_data import load_discourse_index\n"
+        "from course_content.process_data import load_tds_index\n"
+        "load_discourse_index(); load_tds_index()\n"
+    )
+    try:
+        subprocess.run([sys.executable, "-c", code], cwd=workspace, env=server_env(port, args), check=True, stdout=subprocess.DEVNULL)
+    finally:
+        proxy.terminate()
+        proxy.wait(timeout=15)
+
+
+class ApiServer:
+    def __init__(self, workers, env, workspace):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.traces = {}
+        # Each server starts with an empty query cache, so no run reuses another's embeddings
+        env = {**env, "QUERY_CACHE_PATH": os.path.join(workspace, "cache", f"query_cache-w{workers}.sqlite3")}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", ROOT, "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=workspace, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        # The request log lines carry every request's span timings, from whichever worker served it
+        self.reader = threading.Thread(target=self.read_log, daemon=True)
+        self.reader.start()
+        wait_for(self.url + "/", self.process, 300)
+
+    def read_log(self):
+        for line in self.process.stdout:
+            match = LOG_RE.search(line)
+            if match:
+                request_id, answer, total, rest = match.groups()
+                spans = {name: float(ms) for name, ms in SPAN_RE.findall(rest)}
+                self.traces[request_id] = {"answer": answer, "total": float(total), "spans": spans}
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# -------------------- Load --------------------
+def load_questions(seed):
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = [record["question"] for record in json.load(f) if record.get("question")]
+    random.Random(seed).shuffle(questions)
+    return questions
+
+
+async def replay(url, endpoint, questions, concurrency, label):
+    # Returns one (request id, latency in seconds, ok) per question, with `concurrency` requests in flight
+    results = []
+    next_index = iter(range(len(questions)))
+
+    async def worker(client):
+        for i in next_index:
+            request_id = f"{label}-{i}"
+            start = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json={"question": questions[i]}, headers={"X-Request-ID": request_id})
+                ok = response.status_code == 200 and response.json().get("answer") != "An error occurred..."
+            except httpx.HTTPError:
+                ok = False
+            results.append((request_id, time.perf_counter() - start, ok))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return results
+
+
+def summarize(results, elapsed, traces):
+    latencies = np.array([latency for _, latency, _ in results]) * 1000
+    summary = {
+        "requests": len(results),
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "throughput": len(results) / elapsed,
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+    stages, answers = defaultdict(list), defaultdict(int)
+    embedded = 0
+    for request_id, _, _ in results:
+        trace = traces.get(request_id)
+        if trace is None:
+            continue
+        answers[trace["answer"]] += 1
+        embedded += "embedding" in trace["spans"]
+        for name, ms in trace["spans"].items():
+            stages[name].append(ms)
+    summary["answers"] = dict(answers)
+    summary["embedded"] = embedded
+    summary["stages"] = {
+        name: {"count": len(values), "mean": float(np.mean(values)), "p95": float(np.percentile(values, 95))}
+        for name, values in sorted(stages.items())
+    }
+    return summary
+
+
+def print_level(workers, concurrency, summary):
+    print(
+        f"{workers:>7} {concurrency:>11} {summary['requests']:>8} {summary['errors']:>6} {summary['throughput']:>8.1f} "
+        f"{summary['p50']:>8.1f} {summary['p95']:>8.1f} {summary['p99']:>8.1f}"
+    )
+    answers = ", ".join(f"{stage} {n}" for stage, n in sorted(summary["answers"].items()))
+    print(f"{'':>19}answered by: {answers}")
+    print(f"{'':>19}questions embedded: {summary['embedded']} of {summary['requests']}")
+    for name, stage in summary["stages"].items():
+        print(f"{'':>19}{name:<22} n={stage['count']:<5} mean {stage['mean']:>8.1f} ms   p95 {stage['p95']:>8.1f} ms")
+
+
+def run(args):
+    questions = load_questions(args.seed)
+    workspace = make_workspace()
+    print(f"[INFO] Building indexes against the mock proxy in {workspace}")
+    build_indexes(workspace, args)
+    proxy_port = free_port()
+    proxy = start_mock_proxy(proxy_port, args)
+    env = server_env(proxy_port, args)
+    report = []
+    print(f"[INFO] Lexical embedding skip {'on' if args.lexical_skip else 'off'}")
+    try:
+        print(f"{'workers':>7} {'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for workers in args.workers:
+            server = ApiServer(workers, env, workspace)
+            try:
+                if args.warmup:
+                    asyncio.run(replay(server.url, args.endpoint, questions[:args.warmup], min(args.warmup, 8), f"warmup-w{workers}"))
+                for n, concurrency in enumerate(args.concurrency):
+                    # Fresh questions for every level while the corpus lasts, so later levels don't just hit the embedding cache
+                    offset = args.warmup + n * args.requests
+                    batch = [questions[i % len(questions)] for i in range(offset, offset + args.requests)]
+                    label = f"w{workers}-c{concurrency}"
+                    start = time.perf_counter()
+                    results = asyncio.run(replay(server.url, args.endpoint, batch, concurrency, label))
+                    elapsed = time.perf_counter() - start
+                    # Give the log reader a moment to catch up with the last requests
+                    time.sleep(0.5)
+                    summary = summarize(results, elapsed, server.traces)
+                    print_level(workers, concurrency, summary)
+                    report.append({"workers": workers, "concurrency": concurrency, **summary})
+            finally:
+                server.stop()
+    finally:
+        proxy.terminate()
+        proxy.wait(timeout=15)
+        if not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return report
+
+
+def check_gates(report, args):
+    failures = []
+    for level in report:
+        name = f"workers={level['workers']} concurrency={level['concurrency']}"
+        if args.max_p95_ms is not None and level["p95"] > args.max_p95_ms:
+            failures.append(f"{name}: p95 {level['p95']:.1f} ms > {args.max_p95_ms} ms")
+        if args.min_throughput is not None and level["throughput"] < args.min_throughput:
+            failures.append(f"{name}: {level['throughput']:.1f} req/s < {args.min_throughput} req/s")
+        if level["errors"] / level["requests"] > args.max_error_rate:
+            failures.append(f"{name}: {level['errors']} of {level['requests']} requests failed")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay discourse questions against the API server with a mocked upstream proxy (no network needed)."
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="uvicorn worker counts to compare")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="requests in flight")
+    parser.add_argument("--requests", type=int, default=200, help="questions replayed per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured questions sent to each new server")
+    parser.add_argument("--endpoint", default="/api/")
+    parser.add_argument("--answer-mode", choices=["cascade", "race"], default="cascade")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on (off by default)")
+    parser.add_argument("--lexical-skip", action="store_true",
+                        help="let decisive lexical matches skip the question embedding (off by default: the replayed "
+                             "questions are verbatim corpus records, which would almost all skip it)")
+    parser.add_argument("--embedding-latency-ms", type=float, default=30.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=400.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--reject-rate", type=float, default=0.2,
+                        help="fraction of context prompts the mock model finds irrelevant")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep-workspace", action="store_true")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if any level's p95 latency is above this")
+    parser.add_argument("--min-throughput", type=float, help="fail if any level's throughput (req/s) is below this")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="fail if more requests than this fail")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "levels": report}, f, indent=2)
+    failures = check_gates(report, args)
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    sys.exit(1 if failures else 0)
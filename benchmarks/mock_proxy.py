@@ -0,0 +1,135 @@
+import re
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Stand-in for the aiproxy /embeddings and /chat/completions endpoints, for benchmarks that must not
+# touch the network. Replies are deterministic: the same input always gets the same vector or answer.
+settings = {
+    "dimensions": 1536,
+    "embedding_latency_ms": 30.0,
+    "chat_latency_ms": 400.0,
+    "jitter_ms": 0.0,
+    "error_rate": 0.0,
+    "error_status": 500,
+    "reject_rate": 0.0,
+    "seed": 0,
+}
+rng = random.Random(0)
+app = FastAPI()
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+TOPICS_RE = re.compile(r"Topics \(`course_shrinked`\): (\[.*?\])")
+
+
+# -------------------- Deterministic Replies --------------------
+def hashed_embedding(text, dimensions, features_per_word=8):
+    # Feature hashing: every word switches on a few signed dimensions, so texts that share
+    # words get similar vectors and retrieval behaves roughly as it would with a real model
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=4 * features_per_word).digest()
+        for i in range(features_per_word):
+            value = int.from_bytes(digest[4 * i:4 * i + 4], "little")
+            vector[value % dimensions] += 1.0 if value & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+def rejects(text):
+    # A stable fraction of context prompts is answered as "no context was relevant", so the cascade falls through
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2 ** 64 < settings["reject_rate"]
+
+
+def chat_reply(messages):
+    last = messages[-1]["content"]
+    if isinstance(last, list):
+        return "Traceback (most recent call last): ModuleNotFoundError: No module named 'requests'"
+    system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+    if '"relevant" must be one of' in system:
+        if rejects(last + system[:200]):
+            return json.dumps({"answer": "error", "relevant": "error"})
+        return json.dumps({"answer": f"Mock answer to: {last[:80]}", "relevant": 1})
+    topics = TOPICS_RE.search(system)
+    topic = json.loads(topics.group(1))[0] if topics else "course page"
+    return json.dumps({"answer": f"Mock course answer to: {last[:80]}", "topic": topic})
+
+
+# -------------------- Latency / Error Injection --------------------
+async def delay(latency_ms):
+    jitter = rng.uniform(-settings["jitter_ms"], settings["jitter_ms"]) if settings["jitter_ms"] else 0.0
+    await asyncio.sleep(max(0.0, latency_ms + jitter) / 1000)
+
+
+def injected_error():
+    if settings["error_rate"] and rng.random() < settings["error_rate"]:
+        return JSONResponse({"error": {"message": "injected error"}}, status_code=settings["error_status"])
+    return None
+
+
+@app.post("/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await delay(settings["embedding_latency_ms"])
+    error = injected_error()
+    if error is not None:
+        return error
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = [
+        {"object": "embedding", "index": i, "embedding": hashed_embedding(text, settings["dimensions"]).tolist()}
+        for i, text in enumerate(inputs)
+    ]
+    return {"object": "list", "data": data, "model": body.get("model")}
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = injected_error()
+    if error is not None:
+        await delay(settings["chat_latency_ms"] / 4)
+        return error
+    content = chat_reply(body["messages"])
+    if not body.get("stream"):
+        await delay(settings["chat_latency_ms"])
+        return {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+    async def events():
+        # The same total latency, spread over the chunks as if tokens were being generated
+        chunks = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for chunk in chunks:
+            await delay(settings["chat_latency_ms"] / len(chunks))
+            yield "data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": chunk}}]}) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Offline stand-in for the aiproxy embeddings and chat endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--embedding-latency-ms", type=float, default=30.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=400.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter added to every latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--reject-rate", type=float, default=0.0,
+                        help="fraction of context prompts answered with relevant=error")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    settings.update({key: value for key, value in vars(args).items() if key in settings})
+    rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
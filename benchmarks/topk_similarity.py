@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval import normalize_rows, top_k_similar
+
+
+# The pre-vectorization implementation, kept here only as the baseline to compare against
+def sorted_tuples_top_k(user_embedding, qa_data, stored_embeddings, top_n=1, threshold=0.5):
+    a_norm = user_embedding / np.linalg.norm(user_embedding)
+    b_norm = stored_embeddings / np.linalg.norm(stored_embeddings, axis=1, keepdims=True)
+    similarities = np.dot(b_norm, a_norm)
+    scored_results = [(qa_data[i], float(similarities[i])) for i in range(len(qa_data))]
+    sorted_results = sorted(scored_results, key=lambda x: x[1], reverse=True)
+    return [entry for entry in sorted_results if entry[1] >= threshold][:top_n]
+
+
+def time_per_query(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def run(sizes, dim, top_n, queries_per_size):
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>9} {'sorted tuples (ms)':>19} {'argpartition (ms)':>18} {'speedup':>8}")
+    for n in sizes:
+        corpus = rng.standard_normal((n, dim)).astype(np.float32)
+        records = [{"id": i} for i in range(n)]
+        queries = corpus[rng.integers(0, n, queries_per_size)] + rng.standard_normal((queries_per_size, dim)).astype(np.float32) * 0.1
+
+        # Pre-normalizing is a one-off cost paid at index load, not per query
+        normalized = normalize_rows(corpus)
+        baseline = time_per_query(lambda q: sorted_tuples_top_k(q, records, corpus, top_n, 0.0), queries)
+        vectorized = time_per_query(lambda q: top_k_similar(normalized, q, top_n, 0.0), queries)
+        print(f"{n:>9} {baseline:>19.3f} {vectorized:>18.3f} {baseline / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark top-k cosine retrieval as the corpus grows.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000, 300000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.dim, args.top_n, args.queries)
@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 
 # For Discourse fetching, filtering, and processing data
@@ -6,9 +7,141 @@ START_DATE = datetime.strptime("2025-01-01", DATE_FORMAT)
 END_DATE = datetime.strptime("2025-04-14", DATE_FORMAT)
 # Number of discourse pages to scrape
 PAGES = 10
-PYTESSERACT_PATH = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+# Tesseract binary: the default installer location on Windows, `tesseract` from PATH everywhere else
+PYTESSERACT_PATH = os.getenv(
+    "PYTESSERACT_PATH", r'C:\Program Files\Tesseract-OCR\tesseract.exe' if os.name == "nt" else "tesseract"
+)
+# Incremental discourse sync: concurrent topic fetches, and the request rate shared by all of them
+SCRAPE_MAX_WORKERS = 8
+SCRAPE_REQUESTS_PER_SECOND = 8
+# OCR stage of filter_data(): concurrent image downloads, and Tesseract processes (None = one per CPU)
+OCR_DOWNLOAD_WORKERS = 16
+OCR_PROCESS_WORKERS = None
+# Parallel mode of filter_data(): topic files parsed at once (None = one per CPU)
+FILTER_PROCESS_WORKERS = None
 
 
 
 # For course content fetching, filtering, and processing data
-PLAYWRIGHT_BROWSERS_PATH = r"C:\Users\Lovep\miniconda3\playwright"
\ No newline at end of file
+PLAYWRIGHT_BROWSERS_PATH = r"C:\Users\Lovep\miniconda3\playwright"
+COURSE_SITE_URL = "https://tds.s-anand.net/"
+COURSE_SIDEBAR_PATH = "2025-01/_sidebar.md"
+# "http" fetches the docsify markdown sources directly (falling back to the browser if there are none),
+# "browser" renders every page in headless Chromium
+COURSE_SCRAPE_MODE = "http"
+# Concurrent markdown fetches, or browser instances in browser mode
+COURSE_SCRAPE_WORKERS = 8
+COURSE_SCRAPE_HEADLESS = True
+# Retrieve course content by passage (split along headings) instead of by whole page. Off by default: no
+# passage embedding store ships with the repo, so turning it on embeds every passage through the proxy
+# on the first start, and the passages are only split along headings when the scraper saved markdown
+COURSE_PASSAGE_CHUNKS = os.getenv("COURSE_PASSAGE_CHUNKS", "0") == "1"
+# Passage size in characters; longer sections are cut into windows that overlap by COURSE_CHUNK_OVERLAP_CHARS,
+# and sections shorter than COURSE_CHUNK_MIN_CHARS are merged into the next one
+COURSE_CHUNK_MAX_CHARS = 1500
+COURSE_CHUNK_OVERLAP_CHARS = 200
+COURSE_CHUNK_MIN_CHARS = 300
+
+
+# For the embedding stores of both discourse and course content
+# Who embeds questions and records: "remote" (the proxy's OpenAI embeddings) or "local"
+# (an ONNX sentence-embedding model on CPU, needs onnxruntime and tokenizers). Each backend has its own stores.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote")
+EMBEDDING_MODELS = {
+    "remote": "text-embedding-3-small",
+    "local": "all-MiniLM-L6-v2",
+}
+# Directory holding the local model's model.onnx and tokenizer.json
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "models/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_MAX_TOKENS = 256
+# Similarity index used for retrieval: "brute" (exact), "ivf" (pure NumPy inverted file),
+# or "hnsw" (needs hnswlib). See benchmarks/ann_recall.py for recall vs latency.
+INDEX_BACKEND = os.getenv("INDEX_BACKEND", "brute")
+INDEX_BACKEND_PARAMS = {
+    "brute": {},
+    # nlist=None uses sqrt(rows) buckets
+    "ivf": {"nlist": None, "nprobe": 8, "iterations": 10},
+    "hnsw": {"m": 16, "ef_construction": 200, "ef_search": 64},
+}
+# BM25 over the record text, fused with the vector ranking by reciprocal rank (RRF_K dampens rank differences)
+LEXICAL_INDEX = os.getenv("LEXICAL_INDEX", "1") == "1"
+RRF_K = 60
+# Share of the question's idf-weighted terms a BM25 hit must contain to be fused in at all
+LEXICAL_MIN_COVERAGE = 0.5
+
+
+# For the API server's upstream proxy client
+PROXY_BASE_URL = os.getenv("PROXY_BASE_URL", "https://aiproxy.sanand.workers.dev/openai/v1")
+# Seconds to wait for a response from the proxy, and for a new connection to open
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+# Size of the shared keep-alive connection pool
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Maximum number of proxy calls in flight at once across all requests
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# How /api/ runs its answer stages: "cascade" calls discourse, course content and
+# course metadata one after another; "race" starts all three at once and keeps
+# the highest-priority answer, trading extra proxy calls for latency.
+ANSWER_MODE = os.getenv("ANSWER_MODE", "cascade")
+# Answer cache in front of /api/: entry cap (0 disables it), entry lifetime in
+# seconds, and the cosine similarity above which a new question reuses a stored answer
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Persistent cache for query embeddings and screenshot OCR text, so repeated
+# questions and images survive restarts. Point it at a persistent disk if available.
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "cache/query_cache.sqlite3")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "50000"))
+# /api/batch: largest accepted batch, and how many of its questions run LLM stages at once
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+# Contexts retrieved per corpus for the discourse and course content stages, the minimum
+# cosine similarity for a candidate, and the (approximate) token budget they are packed into
+DISCOURSE_TOP_K = int(os.getenv("DISCOURSE_TOP_K", "3"))
+DISCOURSE_THRESHOLD = float(os.getenv("DISCOURSE_THRESHOLD", "0.5"))
+DISCOURSE_CONTEXT_TOKENS = int(os.getenv("DISCOURSE_CONTEXT_TOKENS", "2000"))
+COURSE_TOP_K = int(os.getenv("COURSE_TOP_K", "3"))
+COURSE_THRESHOLD = float(os.getenv("COURSE_THRESHOLD", "0.5"))
+COURSE_CONTEXT_TOKENS = int(os.getenv("COURSE_CONTEXT_TOKENS", "1500"))
+# Candidates at least this similar to a better one are dropped as duplicates
+CONTEXT_DEDUPE_SIMILARITY = float(os.getenv("CONTEXT_DEDUPE_SIMILARITY", "0.97"))
+# Skip the question embedding when one record matches the question's terms this decisively:
+# it holds LEXICAL_DECISIVE_COVERAGE of the idf-weighted terms and outscores the runner-up by LEXICAL_DECISIVE_MARGIN
+LEXICAL_SKIP_EMBEDDING = os.getenv("LEXICAL_SKIP_EMBEDDING", "1") == "1"
+LEXICAL_DECISIVE_COVERAGE = float(os.getenv("LEXICAL_DECISIVE_COVERAGE", "0.8"))
+LEXICAL_DECISIVE_MARGIN = float(os.getenv("LEXICAL_DECISIVE_MARGIN", "1.5"))
+# Answer grading, deadline, exam-format, workload and portal questions from templates, without any LLM call:
+# keyword rules first, then nearest-centroid over example embeddings (cosine >= threshold, ahead by margin).
+# Only questions up to INTENT_MAX_WORDS words are considered.
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "1") == "1"
+INTENT_MAX_WORDS = int(os.getenv("INTENT_MAX_WORDS", "30"))
+INTENT_CENTROID_THRESHOLD = float(os.getenv("INTENT_CENTROID_THRESHOLD", "0.75"))
+INTENT_CENTROID_MARGIN = float(os.getenv("INTENT_CENTROID_MARGIN", "0.05"))
+# Course topics offered to the course_related prompt: the ones closest to the question by embedding
+# (or shared terms before the topic embeddings are ready). 0 sends the full course_shrinked list.
+COURSE_PROMPT_TOPICS = int(os.getenv("COURSE_PROMPT_TOPICS", "8"))
+# Screenshots sent with a question: uniform margins are cropped (pixels within IMAGE_CROP_TOLERANCE of the
+# corner colour, keeping IMAGE_CROP_PADDING around the content), the image is scaled down to at most
+# IMAGE_MAX_PIXELS (the vision model downsizes larger images anyway) and re-encoded as IMAGE_ENCODE_FORMAT.
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(768 * 1536)))
+IMAGE_CROP_TOLERANCE = int(os.getenv("IMAGE_CROP_TOLERANCE", "12"))
+IMAGE_CROP_PADDING = int(os.getenv("IMAGE_CROP_PADDING", "8"))
+IMAGE_ENCODE_FORMAT = os.getenv("IMAGE_ENCODE_FORMAT", "WEBP").upper()
+IMAGE_ENCODE_QUALITY = int(os.getenv("IMAGE_ENCODE_QUALITY", "85"))
+# Screenshot OCR: "vision" (vision model call), "tesseract" (local Tesseract, the vision model only if Tesseract
+# isn't installed) or "auto": Tesseract first, and the vision model only when it reads fewer than
+# IMAGE_TESSERACT_MIN_WORDS words or its mean word confidence is below IMAGE_TESSERACT_MIN_CONFIDENCE,
+# e.g. for diagrams and photos rather than text
+IMAGE_OCR_MODE = os.getenv("IMAGE_OCR_MODE", "auto")
+IMAGE_TESSERACT_MIN_WORDS = int(os.getenv("IMAGE_TESSERACT_MIN_WORDS", "5"))
+IMAGE_TESSERACT_MIN_CONFIDENCE = float(os.getenv("IMAGE_TESSERACT_MIN_CONFIDENCE", "80"))
+IMAGE_OCR_MAX_TOKENS = int(os.getenv("IMAGE_OCR_MAX_TOKENS", "500"))
+# Questions with a screenshot: "merge" embeds the question's own text while the OCR runs, then embeds the OCR text
+# once it arrives and mixes it in with IMAGE_OCR_EMBEDDING_WEIGHT; "serial" waits for the OCR and embeds both together;
+# "rerank" skips the second embedding and leaves the OCR text to the BM25 side of the hybrid ranking, where it
+# only counts when the BM25 hits cover LEXICAL_MIN_COVERAGE of the question and OCR terms
+IMAGE_QUERY_MODE = os.getenv("IMAGE_QUERY_MODE", "merge")
+IMAGE_OCR_EMBEDDING_WEIGHT = float(os.getenv("IMAGE_OCR_EMBEDDING_WEIGHT", "0.5"))
+# Upper bounds (seconds) of the latency histogram buckets served at /metrics
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
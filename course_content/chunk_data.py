@@ -0,0 +1,117 @@
+import re
+from course_content.scrape_data import clean_text, markdown_to_text
+from config import COURSE_CHUNK_MAX_CHARS, COURSE_CHUNK_OVERLAP_CHARS, COURSE_CHUNK_MIN_CHARS
+
+
+# -------------------- Heading Anchors --------------------
+def docsify_slug(heading, seen):
+    # Same ids docsify gives headings, so "?id=<slug>" links land on the section
+    slug = heading.strip().lower()
+    slug = re.sub(r"<[^>\d]+>", "", slug)
+    slug = re.sub(r"[\u2000-\u206F\u2E00-\u2E7F\\'!\"#$%&()*+,./:;<=>?@\[\]^`{|}~]", "", slug)
+    slug = re.sub(r"\s", "-", slug)
+    slug = re.sub(r"-+", "-", slug)
+    slug = re.sub(r"^(\d)", r"_\1", slug)
+    count = seen.get(slug, 0)
+    seen[slug] = count + 1
+    return slug if count == 0 else f"{slug}-{count}"
+
+
+# -------------------- Splitting --------------------
+def split_sections(markdown):
+    # Returns (heading path, anchor, body markdown) for every heading-delimited section
+    sections = []
+    headings = []
+    anchor = None
+    body = []
+    in_fence = False
+    seen = {}
+    for line in markdown.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        heading = None if in_fence else re.match(r"^(#{1,6})\s+(.*?)\s*#*\s*$", line)
+        if heading is None:
+            body.append(line)
+            continue
+        sections.append(([h for _, h in headings], anchor, "\n".join(body)))
+        level, title = len(heading.group(1)), clean_text(markdown_to_text(heading.group(2)))
+        headings = [(l, h) for l, h in headings if l < level] + [(level, title)]
+        anchor = docsify_slug(title, seen)
+        body = []
+    sections.append(([h for _, h in headings], anchor, "\n".join(body)))
+    return [(path, anchor, text) for path, anchor, text in sections if clean_text(markdown_to_text(text))]
+
+
+def split_windows(text, max_chars=COURSE_CHUNK_MAX_CHARS, overlap=COURSE_CHUNK_OVERLAP_CHARS):
+    # Overlapping windows cut at word boundaries, for sections (or pages) longer than one passage
+    if len(text) <= max_chars:
+        return [text]
+    windows = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            space = text.rfind(" ", start + max_chars // 2, end)
+            end = space if space != -1 else end
+        windows.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        next_start = text.find(" ", end - overlap, end)
+        start = next_start + 1 if next_start != -1 else end
+    return windows
+
+
+def merge_small_sections(sections, min_chars=COURSE_CHUNK_MIN_CHARS, max_chars=COURSE_CHUNK_MAX_CHARS):
+    # A short section is folded into the one after it, so a heading followed by a single line
+    # doesn't become a passage of its own. It keeps its own heading and anchor when the two fit
+    # in one passage, otherwise it is just prefixed to the next section.
+    merged = []
+    for path, anchor, text in sections:
+        if merged and len(merged[-1][2]) < min_chars:
+            prev_path, prev_anchor, prev_text = merged[-1]
+            title = path[-1] if path else ""
+            if len(prev_text) + len(text) <= max_chars:
+                merged[-1] = (prev_path, prev_anchor, f"{prev_text} {title}: {text}" if title else f"{prev_text} {text}")
+            else:
+                merged[-1] = (path, anchor, f"{prev_text} {text}")
+        else:
+            merged.append((path, anchor, text))
+    return merged
+
+
+# -------------------- Pages -> Passages --------------------
+def chunk_page(page):
+    page_url = (page.get("url") or "").replace("/../", "/")
+    page_path = page.get("hierarchy", []) + [page["title"].strip()]
+
+    if page.get("markdown"):
+        sections = [
+            (path, anchor, clean_text(markdown_to_text(text)))
+            for path, anchor, text in split_sections(page["markdown"])
+        ]
+    else:
+        # Pages scraped from the rendered site only have flat text: fall back to plain windows
+        sections = [([], None, page.get("content", "").strip())]
+
+    passages = []
+    for path, anchor, text in merge_small_sections(sections):
+        # The page's own title heading adds nothing to the path it is already in
+        if path and path[0] == page_path[-1]:
+            path = path[1:]
+        for window in split_windows(text):
+            passages.append({
+                "question": " > ".join(page_path + path),
+                "answer": window,
+                "answered_by": "TDS Course Page",
+                "url": f"{page_url}?id={anchor}" if anchor else page_url,
+                "page_url": page_url
+            })
+    return passages
+
+
+def chunk_pages(pages):
+    passages = []
+    for page in pages:
+        if page.get("content") or page.get("markdown"):
+            passages.extend(chunk_page(page))
+    return passages
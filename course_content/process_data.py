@@ -1,23 +1,28 @@
 import os
 import json
-import requests
-import numpy as np
 import pickle
 from dotenv import load_dotenv
+from retrieval import RetrievalIndex, find_similar_questions
+from embedding_store import save_embedding_store, load_manifest, sync_embedding_store, backend_store_path, store_version
+from embedding_providers import get_embedding_provider
+from course_content.chunk_data import chunk_pages
+from config import INDEX_BACKEND, INDEX_BACKEND_PARAMS, LEXICAL_INDEX, RRF_K, LEXICAL_MIN_COVERAGE, COURSE_PASSAGE_CHUNKS
+from config import COURSE_CHUNK_MAX_CHARS, COURSE_CHUNK_OVERLAP_CHARS, COURSE_CHUNK_MIN_CHARS
 
 load_dotenv()
 
 TDS_RAW_PATH = "course_content/cache/raw_data/tds_scraped_data.json"
 QA_JSON_PATH = "course_content/cache/filtered_data/tds_filtered.json"
+EMBEDDINGS_STORE_PATH = "course_content/cache/tds_question_embeddings"
+PASSAGES_JSON_PATH = "course_content/cache/filtered_data/tds_passages.json"
+PASSAGE_EMBEDDINGS_STORE_PATH = "course_content/cache/tds_passage_embeddings"
+# Legacy float64 pickle, migrated into the embedding store on first load
 EMBEDDINGS_PICKLE_CACHE_PATH = "course_content/cache/tds_question_embeddings.pkl"
-EMBEDDINGS_JSON_CACHE_PATH = "course_content/cache/tds_question_embeddings.json"
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_EMBEDDING_URL = "https://aiproxy.sanand.workers.dev/openai/v1/embeddings"
-EMBEDDING_MODEL = "text-embedding-3-small"
 
 # -------------------- Step 1: Filter Raw TDS JSON --------------------
 def convert_tds_json_to_qa(input_path=TDS_RAW_PATH, output_path=QA_JSON_PATH):
-    if os.path.exists(output_path):
+    # Reuse the filtered file unless the scraper has written newer raw data since
+    if is_fresh(output_path, input_path):
         print(f"[INFO] Using cached filtered QA data at {output_path}")
         with open(output_path, "r", encoding="utf-8") as f:
             return json.load(f)
@@ -45,102 +50,97 @@ def convert_tds_json_to_qa(input_path=TDS_RAW_PATH, output_path=QA_JSON_PATH):
     return qa_data
 
 
-# -------------------- Embedding JSON Cache Utilities --------------------
-def load_embedding_cache_json(path=EMBEDDINGS_JSON_CACHE_PATH):
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+def is_fresh(output_path, input_path):
+    return os.path.exists(output_path) and (
+        not os.path.exists(input_path) or os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+    )
 
-def save_embedding_cache_json(cache, path=EMBEDDINGS_JSON_CACHE_PATH):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cache, f)
 
-# -------------------- Batch Embedding + Cache --------------------
-def get_cached_embeddings(qa_data, pickle_path=EMBEDDINGS_PICKLE_CACHE_PATH, json_path=EMBEDDINGS_JSON_CACHE_PATH):
-    if os.path.exists(pickle_path):
-        print(f"[INFO] Loading cached embeddings from {pickle_path}")
-        with open(pickle_path, "rb") as f:
-            return pickle.load(f)
+# -------------------- Step 1b: Split Pages into Passages --------------------
+def chunk_settings():
+    return {
+        "max_chars": COURSE_CHUNK_MAX_CHARS,
+        "overlap_chars": COURSE_CHUNK_OVERLAP_CHARS,
+        "min_chars": COURSE_CHUNK_MIN_CHARS,
+    }
 
-    print("[INFO] Computing embeddings from scratch...")
-    questions = [item["answer"] for item in qa_data]
-    embeddings = []
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
+def convert_tds_json_to_passages(input_path=TDS_RAW_PATH, output_path=PASSAGES_JSON_PATH):
+    # The cached passages are only reused if they were split with the current COURSE_CHUNK_* settings
+    settings = chunk_settings()
+    if is_fresh(output_path, input_path):
+        with open(output_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if isinstance(cached, dict) and cached.get("chunk_settings") == settings:
+            print(f"[INFO] Using cached course passages at {output_path}")
+            return cached["passages"]
+        print("[INFO] Chunk settings changed, splitting course pages again")
+
+    with open(input_path, "r", encoding="utf-8") as f:
+        raw_data = json.load(f)
+
+    passages = chunk_pages(raw_data)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"chunk_settings": settings, "passages": passages}, f, indent=2, ensure_ascii=False)
 
-    max_chars_per_batch = 10000
+    print(f"[INFO] Split {len(raw_data)} course pages into {len(passages)} passages.")
+    return passages
+
+
+# -------------------- Batch Embedding + Embedding Store --------------------
+def get_cached_embeddings(qa_data, store_path=EMBEDDINGS_STORE_PATH, pickle_path=EMBEDDINGS_PICKLE_CACHE_PATH):
     max_chars_per_question = 2000
-    current_batch, current_char_count = [], 0
-    batch_num = 0
-
-    for q in questions:
-        cleaned = q.strip()[:max_chars_per_question]
-        if current_char_count + len(cleaned) > max_chars_per_batch:
-            print(f"[INFO] Sending batch {batch_num} with {len(current_batch)} questions")
-            payload = {
-                "model": EMBEDDING_MODEL,
-                "input": current_batch
-            }
-            response = requests.post(OPENAI_EMBEDDING_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            batch_embeddings = [item["embedding"] for item in response.json()["data"]]
-            embeddings.extend(batch_embeddings)
-
-            current_batch = []
-            current_char_count = 0
-            batch_num += 1
-
-        current_batch.append(cleaned)
-        current_char_count += len(cleaned)
-
-    if current_batch:
-        print(f"[INFO] Sending final batch {batch_num} with {len(current_batch)} questions")
-        payload = {
-            "model": EMBEDDING_MODEL,
-            "input": current_batch
-        }
-        response = requests.post(OPENAI_EMBEDDING_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        batch_embeddings = [item["embedding"] for item in response.json()["data"]]
-        embeddings.extend(batch_embeddings)
-
-    embeddings_np = np.array(embeddings)
-
-    with open(pickle_path, "wb") as f:
-        pickle.dump(embeddings_np, f)
-
-    json_cache = {questions[i]: embeddings[i] for i in range(len(questions))}
-    save_embedding_cache_json(json_cache, json_path)
-
-    return embeddings_np
-
-# -------------------- Similarity --------------------
-def cosine_similarity(a, b):
-    a_norm = a / np.linalg.norm(a)
-    b_norm = b / np.linalg.norm(b, axis=1, keepdims=True)
-    return np.dot(b_norm, a_norm)
-
-def find_similar_questions(user_embedding, qa_data, stored_embeddings, top_n=1, threshold=0.5):
-    similarities = cosine_similarity(user_embedding, stored_embeddings)
-
-    scored_results = [
-        (qa_data[i], float(similarities[i]))
-        for i in range(len(qa_data))
-    ]
-    sorted_results = sorted(scored_results, key=lambda x: x[1], reverse=True)
-    return [entry for entry in sorted_results if entry[1] >= threshold][:top_n]
+    questions = [item["answer"].strip()[:max_chars_per_question] for item in qa_data]
+
+    provider = get_embedding_provider()
+    store_path = backend_store_path(store_path, provider.name)
+
+    # The legacy pickle holds remote embeddings
+    if provider.name == "remote" and load_manifest(store_path) is None and os.path.exists(pickle_path):
+        with open(pickle_path, "rb") as f:
+            legacy_embeddings = pickle.load(f)
+        if len(legacy_embeddings) == len(questions):
+            print(f"[INFO] Migrating cached embeddings from {pickle_path}")
+            save_embedding_store(store_path, legacy_embeddings, questions, provider.model)
+
+    # Only new or changed records are sent to the embedding backend; the rest are reused from the store
+    return sync_embedding_store(
+        store_path, questions, provider.model, provider.embed, backend=provider.name
+    )
+
+def get_passage_embeddings(passages, store_path=PASSAGE_EMBEDDINGS_STORE_PATH):
+    # Passages are already under the size limit; their heading path is embedded along with the text
+    texts = [f"{item['question']}\n{item['answer']}" for item in passages]
+    provider = get_embedding_provider()
+    return sync_embedding_store(
+        backend_store_path(store_path, provider.name), texts, provider.model, provider.embed, backend=provider.name
+    )
+
+def load_tds_records():
+    if COURSE_PASSAGE_CHUNKS:
+        passages = convert_tds_json_to_passages()
+        return passages, get_passage_embeddings(passages)
+    qa_data = convert_tds_json_to_qa()
+    return qa_data, get_cached_embeddings(qa_data)
 
 # -------------------- Main Utility --------------------
 def find_similar_questions_later_tds(user_embedding):
-    qa_data = convert_tds_json_to_qa()
-    stored_embeddings = get_cached_embeddings(qa_data)
+    qa_data, stored_embeddings = load_tds_records()
     return find_similar_questions(user_embedding, qa_data, stored_embeddings)
 
+def tds_store_path():
+    store_path = PASSAGE_EMBEDDINGS_STORE_PATH if COURSE_PASSAGE_CHUNKS else EMBEDDINGS_STORE_PATH
+    return backend_store_path(store_path, get_embedding_provider().name)
+
+def load_tds_index():
+    qa_data, stored_embeddings = load_tds_records()
+    return RetrievalIndex(
+        qa_data, stored_embeddings, normalized=True, store_version=store_version(tds_store_path()),
+        backend=INDEX_BACKEND, **INDEX_BACKEND_PARAMS.get(INDEX_BACKEND, {}),
+        lexical_fields=("question", "answer") if LEXICAL_INDEX else None,
+        rrf_k=RRF_K, lexical_min_coverage=LEXICAL_MIN_COVERAGE
+    )
+
 def process_tds_data():
-    qa_data = convert_tds_json_to_qa()
-    get_cached_embeddings(qa_data)
+    load_tds_records()
     return None
\ No newline at end of file
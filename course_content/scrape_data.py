@@ -1,8 +1,26 @@
-from playwright.sync_api import sync_playwright
 import os
-from config import PLAYWRIGHT_BROWSERS_PATH
 import json
 import re
+import hashlib
+import threading
+import requests
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from config import (
+    PLAYWRIGHT_BROWSERS_PATH, COURSE_SITE_URL, COURSE_SIDEBAR_PATH,
+    COURSE_SCRAPE_MODE, COURSE_SCRAPE_WORKERS, COURSE_SCRAPE_HEADLESS
+)
+
+try:
+    from playwright.sync_api import sync_playwright
+except ImportError:
+    sync_playwright = None
+
+RAW_DATA_PATH = "course_content/cache/raw_data/tds_scraped_data.json"
+# Completed pages are flushed to disk this often, so an interrupted crawl keeps its progress
+CHECKPOINT_EVERY = 10
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
 
 
 def clean_text(text):
@@ -22,105 +40,337 @@ def clean_json(data):
         return clean_text(data)
 
 
-def scrape_tds_data():
-    # Configure browser path for Conda environment
-    os.environ["PLAYWRIGHT_BROWSERS_PATH"] = PLAYWRIGHT_BROWSERS_PATH
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
 
-    results = []
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=False,
-            args=["--disable-blink-features=AutomationControlled"]
-        )
-
-        context = browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36",
-            viewport={"width": 1920, "height": 1080}
-        )
-
-        page = context.new_page()
-
-        # Navigate to main page
-        page.goto(
-            "https://tds.s-anand.net/#/2025-01/",
-            wait_until="networkidle",
-            timeout=60000
-        )
-
-        # Wait for sidebar to load
-        page.wait_for_selector("aside.sidebar", state="attached", timeout=15000)
-
-        # Extract sidebar links with hierarchy
-        sidebar_links = page.evaluate('''() => {
-            const links = [];
-            document.querySelectorAll('aside.sidebar .sidebar-nav a').forEach(a => {
-                const hierarchy = [];
-                let current = a.closest('li');
-
-                while(current) {
-                    const folderTitle = current.querySelector('.folder-title');
-                    if(folderTitle) {
-                        hierarchy.unshift(folderTitle.textContent.trim());
-                    }
-                    current = current.parentElement.closest('li');
+# -------------------- Incremental Output --------------------
+def load_previous_pages(path=RAW_DATA_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {page["url"]: page for page in json.load(f)}
+
+
+def save_pages(pages, path=RAW_DATA_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(pages, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+class PageWriter:
+    # Collects scraped pages from the worker threads and writes them out in sidebar order
+    def __init__(self, links, previous, path=RAW_DATA_PATH):
+        self.order = [page_url(link["href"]) for link in links]
+        self.previous = previous
+        self.path = path
+        self.pages = {}
+        self.counts = {"new": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        self.completed = 0
+        # Only rewrite the output when a page actually changed, so downstream steps see an unchanged file
+        self.dirty = False
+        self.written = False
+        self.lock = threading.Lock()
+
+    def add(self, link, page):
+        url = page_url(link["href"])
+        with self.lock:
+            if page is None:
+                self.counts["failed"] += 1
+                # Keep the last good copy of a page that could not be fetched this time
+                if url in self.previous:
+                    self.pages[url] = self.previous[url]
+            else:
+                old = self.previous.get(url)
+                if old is not None and old.get("content_hash") == page["content_hash"]:
+                    self.counts["unchanged"] += 1
+                    self.pages[url] = old
+                else:
+                    self.counts["updated" if old is not None else "new"] += 1
+                    self.pages[url] = page
+                    self.dirty = True
+            self.completed += 1
+            if self.completed % CHECKPOINT_EVERY == 0 and self.dirty:
+                self.write()
+
+    def write(self):
+        # Pages not reached yet keep their last copy, so an interrupted crawl never leaves a partial file
+        pages = [self.pages.get(url, self.previous.get(url)) for url in self.order]
+        save_pages([page for page in pages if page is not None], self.path)
+        self.written = True
+
+    def flush(self):
+        # Once a checkpoint has rewritten the file, the final write is needed to complete it
+        if not self.written and not self.dirty and set(self.pages) == set(self.previous):
+            return
+        with self.lock:
+            self.write()
+
+
+def page_url(href):
+    return f"{COURSE_SITE_URL}{href}"
+
+
+# -------------------- Docsify Markdown Sources --------------------
+def parse_sidebar(markdown):
+    # docsify's _sidebar.md is a nested list: linked items are pages, bare items are folder titles
+    links = []
+    folders = []
+    for line in markdown.splitlines():
+        match = re.match(r"^(\s*)[-*+]\s+(.*)$", line)
+        if not match:
+            continue
+        depth = len(match.group(1).expandtabs(2)) // 2
+        item = match.group(2).strip()
+        folders = [(d, title) for d, title in folders if d < depth]
+        link = re.match(r"^\[(.+?)\]\((\S+?)(?:\s+\"[^\"]*\")?\)", item)
+        if link is None:
+            folders.append((depth, re.sub(r"[*_`]", "", item)))
+            continue
+        path = link.group(2)
+        if re.match(r"^[a-z]+://", path):
+            continue
+        links.append({
+            "href": "#/" + re.sub(r"\.md$", "", path.lstrip("/")),
+            "title": link.group(1).strip(),
+            "hierarchy": [title for _, title in folders],
+            "path": path,
+        })
+    return links
+
+
+def markdown_source_url(path):
+    path = path.split("#")[0].lstrip("/")
+    if path == "" or path.endswith("/"):
+        path += "README"
+    if not path.endswith(".md"):
+        path += ".md"
+    return urljoin(COURSE_SITE_URL, path)
+
+
+def markdown_to_text(markdown):
+    text = re.sub(r"<!--.*?-->", " ", markdown, flags=re.S)
+    text = re.sub(r"^```.*$", " ", text, flags=re.M)
+    text = re.sub(r"!\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"<[^>]+>", " ", text)
+    text = re.sub(r"^\s{0,3}(#{1,6}|>|[-*+]|\d+\.)\s+", "", text, flags=re.M)
+    text = re.sub(r"(\*\*|__|`)", "", text)
+    return text
+
+
+def markdown_links(markdown, href):
+    links = []
+    for text, target in re.findall(r"(?<!!)\[([^\]]*)\]\(([^)\s]+)[^)]*\)", markdown):
+        if target.startswith("#"):
+            url = f"{page_url(href)}?id={target[1:]}"
+        elif re.match(r"^[a-z]+:", target):
+            url = target
+        else:
+            url = page_url("#/" + re.sub(r"\.md$", "", target.lstrip("/")))
+        links.append({"text": text.strip(), "url": url})
+    return links
+
+
+def fetch_markdown_page(session, link, previous):
+    headers = {}
+    # A conditional request lets the server answer 304 for pages that have not changed
+    if previous is not None and previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    resp = session.get(markdown_source_url(link["path"]), headers=headers, timeout=30)
+    if resp.status_code == 304:
+        return previous
+    resp.raise_for_status()
+    resp.encoding = "utf-8"
+    markdown = resp.text
+    return {
+        "title": link["title"],
+        "hierarchy": link["hierarchy"],
+        "content": clean_text(markdown_to_text(markdown)),
+        "markdown": markdown,
+        "links": clean_json(markdown_links(markdown, link["href"])),
+        "url": page_url(link["href"]),
+        "content_hash": content_hash(markdown),
+        "etag": resp.headers.get("ETag"),
+    }
+
+
+def fetch_sidebar(session):
+    try:
+        resp = session.get(urljoin(COURSE_SITE_URL, COURSE_SIDEBAR_PATH), timeout=30)
+    except requests.RequestException:
+        return None
+    if resp.status_code != 200 or "text/html" in resp.headers.get("Content-Type", ""):
+        return None
+    resp.encoding = "utf-8"
+    return parse_sidebar(resp.text)
+
+
+def scrape_markdown_pages(session, links, writer, max_workers=COURSE_SCRAPE_WORKERS):
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(fetch_markdown_page, session, link, writer.previous.get(page_url(link["href"]))): link
+            for link in links
+        }
+        for future in as_completed(futures):
+            link = futures[future]
+            try:
+                writer.add(link, future.result())
+            except Exception as e:
+                print(f"  Failed to fetch {link['title']}: {e}")
+                writer.add(link, None)
+
+
+# -------------------- Rendered Pages (Playwright) --------------------
+def open_site(p, headless):
+    browser = p.chromium.launch(
+        headless=headless,
+        args=["--disable-blink-features=AutomationControlled"]
+    )
+    context = browser.new_context(
+        user_agent=USER_AGENT,
+        viewport={"width": 1920, "height": 1080}
+    )
+    page = context.new_page()
+
+    # Navigate to main page
+    page.goto(
+        f"{COURSE_SITE_URL}#/{os.path.dirname(COURSE_SIDEBAR_PATH)}/",
+        wait_until="networkidle",
+        timeout=60000
+    )
+
+    # Wait for sidebar to load
+    page.wait_for_selector("aside.sidebar", state="attached", timeout=15000)
+    return browser, page
+
+
+def read_sidebar_links(page):
+    # Extract sidebar links with hierarchy
+    return page.evaluate('''() => {
+        const links = [];
+        document.querySelectorAll('aside.sidebar .sidebar-nav a').forEach(a => {
+            const hierarchy = [];
+            let current = a.closest('li');
+
+            while(current) {
+                const folderTitle = current.querySelector('.folder-title');
+                if(folderTitle) {
+                    hierarchy.unshift(folderTitle.textContent.trim());
                 }
+                current = current.parentElement.closest('li');
+            }
 
-                links.push({
-                    href: a.getAttribute('href'),
-                    title: a.textContent.trim(),
-                    hierarchy: hierarchy
-                });
+            links.push({
+                href: a.getAttribute('href'),
+                title: a.textContent.trim(),
+                hierarchy: hierarchy
             });
-            return links;
-        }''')
+        });
+        return links;
+    }''')
+
+
+def scrape_rendered_page(page, link):
+    previous_html = page.evaluate('''() => {
+        const article = document.querySelector('article.markdown-section');
+        return article ? article.innerHTML : '';
+    }''')
 
-        print(f"Found {len(sidebar_links)} content pages to scrape")
+    # Navigate using hash directly
+    page.evaluate("hash => { window.location.hash = hash; }", link["href"])
 
-        # Scrape each content page
-        for idx, link in enumerate(sidebar_links):
-            print(f"\nScraping ({idx + 1}/{len(sidebar_links)}): {link['title']}")
+    # Wait until docsify has swapped in the new article, not just for any article
+    page.wait_for_function('''previous => {
+        const article = document.querySelector('article.markdown-section');
+        return article && article.innerHTML.length > 100 && article.innerHTML !== previous;
+    }''', arg=previous_html, timeout=15000)
 
-            # Navigate using hash directly
-            page.evaluate(f"window.location.hash = '{link['href']}'")
+    # Extract content
+    content = page.query_selector('article.markdown-section').inner_text()
+    links_in_content = page.eval_on_selector_all('article.markdown-section a', '''elements =>
+        elements.map(a => ({
+            text: a.textContent.trim(),
+            url: a.href
+        }))
+    ''')
+    content = content.strip()
+    return clean_json({
+        "title": link['title'],
+        "hierarchy": link['hierarchy'],
+        "content": content,
+        "links": links_in_content,
+        "url": page_url(link['href']),
+        "content_hash": content_hash(content),
+    })
 
-            # Wait for content update
+
+def scrape_rendered_pages(links, writer, headless):
+    # Each worker thread drives its own browser; a sync Playwright instance can't be shared across threads
+    def worker(assigned):
+        with sync_playwright() as p:
+            browser, page = open_site(p, headless)
             try:
-                page.wait_for_function('''() => {
-                    const article = document.querySelector('article.markdown-section');
-                    return article && article.innerHTML.length > 100;
-                }''', timeout=15000)
-            except:
-                print(f"  Timed out waiting for content: {link['title']}")
-                continue
-
-            # Extract content
-            content = page.query_selector('article.markdown-section').inner_text()
-            links_in_content = page.eval_on_selector_all('article.markdown-section a', '''elements => 
-                elements.map(a => ({
-                    text: a.textContent.trim(),
-                    url: a.href
-                }))
-            ''')
-
-            # Store results
-            results.append({
-                "title": link['title'],
-                "hierarchy": link['hierarchy'],
-                "content": content.strip(),
-                "links": links_in_content,
-                "url": f"https://tds.s-anand.net/{link['href']}"
-            })
-
-        browser.close()
-
-    results = clean_json(results)
-    # Save results
-    with open("course_content/cache/raw_data/tds_scraped_data.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
-
-    print("\nScraping completed. Data saved to tds_scraped_data.json")
+                for link in assigned:
+                    print(f"  Scraping: {link['title']}")
+                    try:
+                        writer.add(link, scrape_rendered_page(page, link))
+                    except Exception as e:
+                        print(f"  Timed out waiting for content: {link['title']} ({e})")
+                        writer.add(link, None)
+            finally:
+                browser.close()
+
+    workers = max(1, min(COURSE_SCRAPE_WORKERS, len(links)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(worker, links[i::workers]) for i in range(workers)]:
+            future.result()
+
+
+def browser_sidebar_links(headless):
+    with sync_playwright() as p:
+        browser, page = open_site(p, headless)
+        try:
+            return read_sidebar_links(page)
+        finally:
+            browser.close()
+
+
+# -------------------- Entry Point --------------------
+def scrape_tds_data(mode=COURSE_SCRAPE_MODE, headless=COURSE_SCRAPE_HEADLESS, incremental=True):
+    # Configure browser path for Conda environment
+    os.environ["PLAYWRIGHT_BROWSERS_PATH"] = PLAYWRIGHT_BROWSERS_PATH
+    previous = load_previous_pages() if incremental else {}
+
+    links = None
+    if mode == "http":
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=COURSE_SCRAPE_WORKERS))
+        links = fetch_sidebar(session)
+        if links is None:
+            print("[WARN] No docsify sidebar source found, falling back to the browser scraper")
+
+    if links is not None:
+        print(f"Found {len(links)} content pages to fetch")
+        writer = PageWriter(links, previous)
+        scrape_markdown_pages(session, links, writer)
+    else:
+        if sync_playwright is None:
+            raise ImportError("The browser scraper needs `pip install playwright`")
+        links = browser_sidebar_links(headless)
+        print(f"Found {len(links)} content pages to scrape")
+        writer = PageWriter(links, previous)
+        scrape_rendered_pages(links, writer, headless)
+
+    writer.flush()
+    counts = writer.counts
+    print(f"\nScraping completed: {counts['new']} new, {counts['updated']} updated, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed. Data saved to {RAW_DATA_PATH}")
+    return counts
 
 
 if __name__ == "__main__":
-    scrape_tds_data()
+    import sys
+    scrape_tds_data(incremental="--full" not in sys.argv)
@@ -1,19 +1,16 @@
 import json
 import re
-import requests
-import pytesseract
-from PIL import Image
-from io import BytesIO
 from bs4 import BeautifulSoup
 import os
-from config import PYTESSERACT_PATH
+from concurrent.futures import ProcessPoolExecutor
+from config import FILTER_PROCESS_WORKERS
+from discourse_content.ocr_stage import run_ocr_stage, download_image, ocr_image_bytes
 
 # Paths
 INPUT_DIR = "discourse_content/cache/raw_posts"
 OUTPUT_FILE = "discourse_content/cache/filtered_posts/discourse_filtered.json"
-
-# Tesseract path (optional for Windows users)
-pytesseract.pytesseract.tesseract_cmd = PYTESSERACT_PATH
+# Written by the parallel mode, one Q&A pair per line
+OUTPUT_JSONL_FILE = "discourse_content/cache/filtered_posts/discourse_filtered.jsonl"
 
 TARGET_USERS = {"carlton", "Saransh_Saini", "Jivraj", "s.anand"}
 
@@ -26,23 +23,36 @@ def extract_image_urls(cooked):
 
 def ocr_from_url(url):
     try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        image = Image.open(BytesIO(r.content))
-        # Convert palette images with transparency to RGBA first
-        if image.mode == "P":
-            image = image.convert("RGBA")
-        else:
-            image = image.convert("RGB")
-        return pytesseract.image_to_string(image).strip()
+        return ocr_image_bytes(download_image(url))
     except Exception as e:
         return f"[OCR error: {str(e)}]"
 
 
-def process_posts(posts):
+def matched_pairs(posts):
     post_dict = {p["post_number"]: p for p in posts}
+    for post in posts:
+        if post.get("reply_to_post_number") and post["username"] in TARGET_USERS:
+            question_post = post_dict.get(post["reply_to_post_number"])
+            if question_post:
+                yield question_post, post
+
+
+def collect_image_urls(posts):
+    urls = []
+    for question_post, answer_post in matched_pairs(posts):
+        urls.extend(extract_image_urls(question_post["cooked"]))
+        urls.extend(extract_image_urls(answer_post["cooked"]))
+    return urls
+
+
+def process_posts(posts, ocr_texts=None):
     qa_pairs = []
 
+    def ocr(url):
+        if ocr_texts is not None and url in ocr_texts:
+            return ocr_texts[url]
+        return ocr_from_url(url)
+
     def clean_text(text):
         text = re.sub(r"(?:Screenshot|image)[^\n]*?\d+×\d+[^\n]*?KB", "", text, flags=re.IGNORECASE)
         text = re.sub(r'@\w+', '', text)  # Remove @mentions like @user
@@ -50,46 +60,77 @@ def process_posts(posts):
         text = text.replace('\n', ' ')
         return re.sub(r'\s+', ' ', text).strip()
 
-    for post in posts:
-        if post.get("reply_to_post_number") and post["username"] in TARGET_USERS:
-            answer_post = post
-            question_post = post_dict.get(answer_post["reply_to_post_number"])
-            if not question_post:
-                continue
+    # A question with several staff replies is only parsed and OCR'd once
+    post_texts = {}
+
+    def post_text(post):
+        if post["post_number"] not in post_texts:
+            text = clean_text(clean_html_and_remove_noise(post["cooked"]))
+            image_ocr = [ocr(url) for url in extract_image_urls(post["cooked"])]
+            if any(image_ocr):
+                text += " [Image OCR] " + " ".join(clean_text(txt) for txt in image_ocr)
+            post_texts[post["post_number"]] = text
+        return post_texts[post["post_number"]]
+
+    for question_post, answer_post in matched_pairs(posts):
+        q_text = post_text(question_post)
+        a_text = post_text(answer_post)
+
+        qa_pairs.append({
+            "question": q_text,
+            "answer": a_text,
+            "answered_by": answer_post["username"],
+            "url": f"https://discourse.onlinedegree.iitm.ac.in{answer_post['post_url']}"
+        })
 
-            q_text = clean_text(clean_html_and_remove_noise(question_post["cooked"]))
-            a_text = clean_text(clean_html_and_remove_noise(answer_post["cooked"]))
+    return qa_pairs
 
-            q_images = extract_image_urls(question_post["cooked"])
-            a_images = extract_image_urls(answer_post["cooked"])
+def filter_topic_file(filepath):
+    with open(filepath, "r", encoding="utf-8") as f:
+        posts = json.load(f)
+    # Already inside a pool worker: download images on threads, run Tesseract in this process
+    ocr_texts = run_ocr_stage(collect_image_urls(posts), use_processes=False)
+    return process_posts(posts, ocr_texts)
 
-            q_ocr = [ocr_from_url(url) for url in q_images]
-            a_ocr = [ocr_from_url(url) for url in a_images]
 
-            if any(q_ocr):
-                q_text += " [Image OCR] " + " ".join(clean_text(txt) for txt in q_ocr)
-            if any(a_ocr):
-                a_text += " [Image OCR] " + " ".join(clean_text(txt) for txt in a_ocr)
+def filter_data_parallel(max_workers=FILTER_PROCESS_WORKERS):
+    filenames = sorted(f for f in os.listdir(INPUT_DIR) if f.endswith(".json"))
+    filepaths = [os.path.join(INPUT_DIR, f) for f in filenames]
+    total = 0
 
-            qa_pairs.append({
-                "question": q_text,
-                "answer": a_text,
-                "answered_by": answer_post["username"],
-                "url": f"https://discourse.onlinedegree.iitm.ac.in{answer_post['post_url']}"
-            })
+    # Each topic's pairs are written out as soon as it is done, so memory stays flat however many topics there are
+    with ProcessPoolExecutor(max_workers=max_workers) as pool, \
+            open(OUTPUT_JSONL_FILE + ".tmp", "w", encoding="utf-8") as out:
+        for filename, qa_cleaned in zip(filenames, pool.map(filter_topic_file, filepaths, chunksize=4)):
+            print(f"📄 Processed {filename}: {len(qa_cleaned)} Q&A pairs")
+            for pair in qa_cleaned:
+                out.write(json.dumps(pair, ensure_ascii=False) + "\n")
+            total += len(qa_cleaned)
+    os.replace(OUTPUT_JSONL_FILE + ".tmp", OUTPUT_JSONL_FILE)
 
-    return qa_pairs
+    print(f"\n✅ Total {total} Q&A pairs saved to {OUTPUT_JSONL_FILE}")
 
-def filter_data():
-    all_qa_pairs = []
+
+def filter_data(parallel=False):
+    if parallel:
+        return filter_data_parallel()
+
+    topics = []
     for filename in os.listdir(INPUT_DIR):
         if filename.endswith(".json"):
             filepath = os.path.join(INPUT_DIR, filename)
             with open(filepath, "r", encoding="utf-8") as f:
-                posts = json.load(f)
-                print(f"📄 Processing {filename} with {len(posts)} posts...")
-                qa_cleaned = process_posts(posts)
-                all_qa_pairs.extend(qa_cleaned)
+                topics.append((filename, json.load(f)))
+
+    # OCR every image of every matched post up front, concurrently and through the on-disk cache
+    image_urls = [url for _, posts in topics for url in collect_image_urls(posts)]
+    ocr_texts = run_ocr_stage(image_urls)
+
+    all_qa_pairs = []
+    for filename, posts in topics:
+        print(f"📄 Processing {filename} with {len(posts)} posts...")
+        qa_cleaned = process_posts(posts, ocr_texts)
+        all_qa_pairs.extend(qa_cleaned)
 
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
         json.dump(all_qa_pairs, f, indent=2, ensure_ascii=False)
@@ -97,4 +138,5 @@ def filter_data():
     print(f"\n✅ Total {len(all_qa_pairs)} Q&A pairs saved to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    filter_data()
+    import sys
+    filter_data(parallel="--parallel" in sys.argv)
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import requests
+import pytesseract
+from PIL import Image
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config import PYTESSERACT_PATH, OCR_DOWNLOAD_WORKERS, OCR_PROCESS_WORKERS
+
+OCR_CACHE_DIR = "discourse_content/cache/ocr"
+
+# Tesseract path (optional for Windows users); set at import so pool workers pick it up too
+pytesseract.pytesseract.tesseract_cmd = PYTESSERACT_PATH
+
+
+# -------------------- On-disk OCR Cache --------------------
+# One small file per entry, so concurrent pipeline processes never contend on a shared file.
+# URLs map to the sha256 of the image they served; image hashes map to the OCR text.
+def _cache_path(kind, key):
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest() if kind == "url" else key
+    return os.path.join(OCR_CACHE_DIR, kind, digest[:2], digest + ".json")
+
+
+def _read_cache(kind, key):
+    path = _cache_path(kind, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_cache(kind, key, value):
+    path = _cache_path(kind, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + f".{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(path + f".{os.getpid()}.tmp", path)
+
+
+def cached_ocr_text(url):
+    entry = _read_cache("url", url)
+    if entry is None:
+        return None
+    content = _read_cache("content", entry["sha256"])
+    return content["text"] if content is not None else None
+
+
+# -------------------- Download + OCR --------------------
+def download_image(url):
+    r = requests.get(url, timeout=10)
+    r.raise_for_status()
+    return r.content
+
+
+def tesseract_image(image):
+    # Convert palette images with transparency to RGBA first
+    if image.mode == "P":
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def ocr_image_bytes(data):
+    try:
+        image = Image.open(BytesIO(data))
+        return pytesseract.image_to_string(tesseract_image(image)).strip()
+    except Exception as e:
+        return f"[OCR error: {str(e)}]"
+
+
+def ocr_image_lines(image):
+    # One Tesseract pass that also reports how sure it was: (text, mean word confidence, word count)
+    data = pytesseract.image_to_data(tesseract_image(image), output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(float(data["conf"][i]))
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence, len(confidences)
+
+
+def run_ocr_stage(urls, download_workers=OCR_DOWNLOAD_WORKERS, ocr_workers=OCR_PROCESS_WORKERS, use_processes=True):
+    results = {}
+    pending = []
+    for url in dict.fromkeys(urls):
+        text = cached_ocr_text(url)
+        if text is not None:
+            results[url] = text
+        else:
+            pending.append(url)
+    print(f"🖼️ OCR stage: {len(results)} images cached, {len(pending)} to fetch")
+    if not pending:
+        return results
+
+    def fetch(url):
+        try:
+            return url, download_image(url), None
+        except Exception as e:
+            return url, None, e
+
+    # Downloads are network bound, so a thread pool is enough to overlap them
+    to_ocr = {}
+    with ThreadPoolExecutor(max_workers=download_workers) as pool:
+        for url, data, error in pool.map(fetch, pending):
+            if error is not None:
+                # Not cached, so the image is retried on the next run
+                results[url] = f"[OCR error: {str(error)}]"
+                continue
+            digest = hashlib.sha256(data).hexdigest()
+            _write_cache("url", url, {"url": url, "sha256": digest})
+            content = _read_cache("content", digest)
+            if content is not None:
+                results[url] = content["text"]
+            else:
+                to_ocr.setdefault(digest, (data, []))[1].append(url)
+
+    # Tesseract is CPU bound: spread it over one process per core
+    digests = list(to_ocr)
+    images = [to_ocr[d][0] for d in digests]
+    if use_processes and len(images) > 1:
+        with ProcessPoolExecutor(max_workers=ocr_workers) as pool:
+            texts = list(pool.map(ocr_image_bytes, images))
+    else:
+        texts = [ocr_image_bytes(data) for data in images]
+
+    for digest, text in zip(digests, texts):
+        if not text.startswith("[OCR error:"):
+            _write_cache("content", digest, {"text": text})
+        for url in to_ocr[digest][1]:
+            results[url] = text
+    print(f"🖼️ OCR stage: ran Tesseract on {len(images)} new images")
+    return results
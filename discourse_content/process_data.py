@@ -1,115 +1,54 @@
 import os
 import json
-import requests
-import numpy as np
 import pickle
 from dotenv import load_dotenv
+from retrieval import RetrievalIndex, find_similar_questions
+from embedding_store import save_embedding_store, load_manifest, sync_embedding_store, backend_store_path, store_version
+from embedding_providers import get_embedding_provider
+from config import INDEX_BACKEND, INDEX_BACKEND_PARAMS, LEXICAL_INDEX, RRF_K, LEXICAL_MIN_COVERAGE
 
 # Load environment variables
 load_dotenv()
 # Constants
 QA_JSON_PATH = "discourse_content/cache/filtered_posts/discourse_filtered.json"
+QA_JSONL_PATH = "discourse_content/cache/filtered_posts/discourse_filtered.jsonl"
+EMBEDDINGS_STORE_PATH = "discourse_content/cache/question_embeddings"
+# Legacy float64 pickle, migrated into the embedding store on first load
 EMBEDDINGS_PICKLE_CACHE_PATH = "discourse_content/cache/question_embeddings.pkl"
-EMBEDDINGS_JSON_CACHE_PATH = "discourse_content/cache/question_embeddings.json"
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_EMBEDDING_URL = "https://aiproxy.sanand.workers.dev/openai/v1/embeddings"
-EMBEDDING_MODEL = "text-embedding-3-small"
 
 # -------------------- Load Q&A Data --------------------
-def load_qa_data(path=QA_JSON_PATH):
+def latest_qa_path():
+    # filter_data() writes JSON, its parallel mode JSON Lines: use whichever was written last
+    candidates = [p for p in (QA_JSON_PATH, QA_JSONL_PATH) if os.path.exists(p)]
+    return max(candidates, key=os.path.getmtime) if candidates else QA_JSON_PATH
+
+def load_qa_data(path=None):
+    path = path or latest_qa_path()
     with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
         return json.load(f)
 
-# -------------------- JSON Cache Utilities --------------------
-def load_embedding_cache_json(path=EMBEDDINGS_JSON_CACHE_PATH):
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_embedding_cache_json(cache, path=EMBEDDINGS_JSON_CACHE_PATH):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cache, f)
-
-# -------------------- Compute All Embeddings and Save to Pickle & JSON --------------------
-def get_cached_embeddings(qa_data, pickle_path=EMBEDDINGS_PICKLE_CACHE_PATH, json_path=EMBEDDINGS_JSON_CACHE_PATH):
-    if os.path.exists(pickle_path):
-        print(f"[INFO] Loading cached embeddings from {pickle_path}")
-        with open(pickle_path, "rb") as f:
-            return pickle.load(f)
-
-    print("[INFO] Computing embeddings and saving to cache...")
-    questions = [item["question"] for item in qa_data]
-    embeddings = []
-
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    max_chars_per_batch = 10000
+# -------------------- Compute All Embeddings and Save to the Embedding Store --------------------
+def get_cached_embeddings(qa_data, store_path=EMBEDDINGS_STORE_PATH, pickle_path=EMBEDDINGS_PICKLE_CACHE_PATH):
     max_chars_per_question = 2000
-    current_batch = []
-    current_char_count = 0
-    batch_num = 0
-
-    for q in questions:
-        cleaned = q.strip()[:max_chars_per_question]
-        if current_char_count + len(cleaned) > max_chars_per_batch:
-            print(f"[INFO] Sending batch {batch_num} with {len(current_batch)} questions ({current_char_count} chars)")
-            payload = {
-                "model": EMBEDDING_MODEL,
-                "input": current_batch
-            }
-            response = requests.post(OPENAI_EMBEDDING_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            batch_embeddings = [item["embedding"] for item in response.json()["data"]]
-            embeddings.extend(batch_embeddings)
-
-            batch_num += 1
-            current_batch = []
-            current_char_count = 0
-
-        current_batch.append(cleaned)
-        current_char_count += len(cleaned)
+    questions = [item["question"].strip()[:max_chars_per_question] for item in qa_data]
 
-    if current_batch:
-        print(f"[INFO] Sending final batch {batch_num} with {len(current_batch)} questions ({current_char_count} chars)")
-        payload = {
-            "model": EMBEDDING_MODEL,
-            "input": current_batch
-        }
-        response = requests.post(OPENAI_EMBEDDING_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        batch_embeddings = [item["embedding"] for item in response.json()["data"]]
-        embeddings.extend(batch_embeddings)
+    provider = get_embedding_provider()
+    store_path = backend_store_path(store_path, provider.name)
 
-    embeddings_np = np.array(embeddings)
-
-    with open(pickle_path, "wb") as f:
-        pickle.dump(embeddings_np, f)
-
-    # Also cache to JSON for reuse of individual embeddings
-    json_cache = {questions[i]: embeddings[i] for i in range(len(questions))}
-    save_embedding_cache_json(json_cache, json_path)
-
-    return embeddings_np
-
-# -------------------- Similarity Functions --------------------
-def cosine_similarity(a, b):
-    a_norm = a / np.linalg.norm(a)
-    b_norm = b / np.linalg.norm(b, axis=1, keepdims=True)
-    return np.dot(b_norm, a_norm)
-
-def find_similar_questions(user_embedding, qa_data, stored_embeddings, top_n=1, threshold=0.5):
-    similarities = cosine_similarity(user_embedding, stored_embeddings)
+    # The legacy pickle holds remote embeddings
+    if provider.name == "remote" and load_manifest(store_path) is None and os.path.exists(pickle_path):
+        with open(pickle_path, "rb") as f:
+            legacy_embeddings = pickle.load(f)
+        if len(legacy_embeddings) == len(questions):
+            print(f"[INFO] Migrating cached embeddings from {pickle_path}")
+            save_embedding_store(store_path, legacy_embeddings, questions, provider.model)
 
-    scored_results = [
-        (qa_data[i], float(similarities[i]))
-        for i in range(len(qa_data))
-    ]
-    sorted_results = sorted(scored_results, key=lambda x: x[1], reverse=True)
-    return [entry for entry in sorted_results if entry[1] >= threshold][:top_n]
+    # Only new or changed records are sent to the embedding backend; the rest are reused from the store
+    return sync_embedding_store(
+        store_path, questions, provider.model, provider.embed, backend=provider.name
+    )
 
 # -------------------- Entry Point Function --------------------
 def find_similar_questions_later(user_embedding):
@@ -117,6 +56,17 @@ def find_similar_questions_later(user_embedding):
     stored_embeddings = get_cached_embeddings(qa_data)
     return find_similar_questions(user_embedding, qa_data, stored_embeddings)
 
+def load_discourse_index():
+    qa_data = load_qa_data()
+    stored_embeddings = get_cached_embeddings(qa_data)
+    return RetrievalIndex(
+        qa_data, stored_embeddings, normalized=True,
+        store_version=store_version(backend_store_path(EMBEDDINGS_STORE_PATH, get_embedding_provider().name)),
+        backend=INDEX_BACKEND, **INDEX_BACKEND_PARAMS.get(INDEX_BACKEND, {}),
+        lexical_fields=("question", "answer") if LEXICAL_INDEX else None,
+        rrf_k=RRF_K, lexical_min_coverage=LEXICAL_MIN_COVERAGE
+    )
+
 def process_data():
     qa_data = load_qa_data()
     get_cached_embeddings(qa_data)
@@ -2,16 +2,23 @@ import os
 import pickle
 import json
 import requests
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 import undetected_chromedriver as uc
-from config import START_DATE, END_DATE, PAGES, DATE_FORMAT
+from config import START_DATE, END_DATE, PAGES, DATE_FORMAT, SCRAPE_MAX_WORKERS, SCRAPE_REQUESTS_PER_SECOND
 import time
 
 CATEGORY_URL = "https://discourse.onlinedegree.iitm.ac.in/c/courses/tds-kb/34"
 CATEGORY_API_URL = CATEGORY_URL + ".json"
 TOPIC_API_FMT = "https://discourse.onlinedegree.iitm.ac.in/t/{slug}/{id}.json"
+POSTS_API_FMT = "https://discourse.onlinedegree.iitm.ac.in/t/{id}/posts.json"
 COOKIE_FILE = "discourse_content/discourse_cookies.pkl"
 cache_dir = "discourse_content/cache/raw_posts"
+SYNC_STATE_FILE = "discourse_content/cache/sync_state.json"
+# Discourse serves at most this many posts per posts.json request
+POSTS_PER_REQUEST = 20
 
 def save_cookies(driver):
     with open(COOKIE_FILE, "wb") as f:
@@ -65,7 +72,9 @@ def fetch_all_category_topics(session):
                 topics.append({
                     "id": t["id"],
                     "slug": t["slug"],
-                    "title": t["title"]
+                    "title": t["title"],
+                    "posts_count": t.get("posts_count"),
+                    "last_posted_at": t.get("last_posted_at")
                 })
             else:
                 print(f"   ⚠️ Skipping topic: {t['title']} (created on {created})")
@@ -109,9 +118,120 @@ def fetch_posts(session, topic_id, slug):
 
     return all_posts
 
-def scrape_data():
+# -------------------- Incremental Sync --------------------
+class RateLimiter:
+    # Spaces requests out to at most `rate` per second across every worker thread
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_sync_state():
+    if os.path.exists(SYNC_STATE_FILE):
+        with open(SYNC_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_sync_state(state):
+    with open(SYNC_STATE_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(SYNC_STATE_FILE + ".tmp", SYNC_STATE_FILE)
+
+
+def topic_unchanged(topic, cached_posts, known):
+    if known:
+        return known.get("posts_count") == topic["posts_count"] and known.get("last_posted_at") == topic["last_posted_at"]
+    # No sync record yet (cache written by a full scrape): trust it if the post count still matches
+    return len(cached_posts) == topic["posts_count"]
+
+
+def sync_topic_posts(session, limiter, topic, known):
+    cache_file = os.path.join(cache_dir, f"{topic['id']}_posts.json")
+    cached_posts = []
+    if os.path.exists(cache_file):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached_posts = json.load(f)
+        if topic_unchanged(topic, cached_posts, known):
+            return "unchanged", len(cached_posts)
+
+    # The first topic page carries the ids of every post in the thread, plus the first few posts
+    limiter.wait()
+    resp = session.get(TOPIC_API_FMT.format(slug=topic["slug"], id=topic["id"]))
+    resp.raise_for_status()
+    post_stream = resp.json().get("post_stream", {})
+    stream_ids = post_stream.get("stream", [])
+    posts_by_id = {p["id"]: p for p in cached_posts}
+    for p in post_stream.get("posts", []):
+        posts_by_id[p["id"]] = p
+
+    missing = [pid for pid in stream_ids if pid not in posts_by_id]
+    for start in range(0, len(missing), POSTS_PER_REQUEST):
+        limiter.wait()
+        chunk = missing[start:start + POSTS_PER_REQUEST]
+        resp = session.get(POSTS_API_FMT.format(id=topic["id"]), params={"post_ids[]": chunk})
+        resp.raise_for_status()
+        for p in resp.json().get("post_stream", {}).get("posts", []):
+            posts_by_id[p["id"]] = p
+
+    # Keep the thread order and drop posts that have since been deleted
+    all_posts = [posts_by_id[pid] for pid in stream_ids if pid in posts_by_id]
+    with open(cache_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(all_posts, f, indent=2)
+    os.replace(cache_file + ".tmp", cache_file)
+    return ("updated" if cached_posts else "new"), len(all_posts)
+
+
+def sync_data(session, max_workers=SCRAPE_MAX_WORKERS, requests_per_second=SCRAPE_REQUESTS_PER_SECOND):
+    os.makedirs(cache_dir, exist_ok=True)
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+    limiter = RateLimiter(requests_per_second)
+    state = load_sync_state()
+    topics = fetch_all_category_topics(session)
+
+    counts = {"new": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(sync_topic_posts, session, limiter, topic, state.get(str(topic["id"]))): topic
+            for topic in topics
+        }
+        for future in as_completed(futures):
+            topic = futures[future]
+            try:
+                status, post_count = future.result()
+            except Exception as e:
+                print(f"   ❌ Failed to sync topic {topic['id']} ({topic['title']}): {e}")
+                counts["failed"] += 1
+                continue
+            counts[status] += 1
+            if status != "unchanged":
+                print(f"   🔄 {status.capitalize()} topic {topic['id']}: {post_count} posts cached")
+            state[str(topic["id"])] = {
+                "slug": topic["slug"],
+                "posts_count": topic["posts_count"],
+                "last_posted_at": topic["last_posted_at"]
+            }
+    save_sync_state(state)
+    print(f"✅ Sync complete: {counts['new']} new, {counts['updated']} updated, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed")
+    return counts
+
+
+def scrape_data(incremental=True):
     driver, session = login_if_needed()
     try:
+        if incremental:
+            sync_data(session)
+            return
         topics = fetch_all_category_topics(session)
         for i, topic in enumerate(topics, 1):
             print(f"\n📌 [{i}] {topic['title']}")
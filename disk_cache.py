@@ -0,0 +1,138 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+
+def content_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# -------------------- SQLite-backed Persistent Cache --------------------
+class DiskCache:
+    def __init__(self, path, max_entries=50000, evict_batch=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_batch = evict_batch if evict_batch is not None else max(1, max_entries // 100)
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _get(self, namespace, key):
+        row = self._conn.execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            return None
+        self._conn.execute(
+            "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+            (time.time(), namespace, key)
+        )
+        self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        return row[0]
+
+    def _set(self, namespace, key, value):
+        updated = self._conn.execute(
+            "UPDATE entries SET value = ?, accessed = ? WHERE namespace = ? AND key = ?",
+            (value, time.time(), namespace, key)
+        ).rowcount
+        if not updated:
+            self._conn.execute(
+                "INSERT INTO entries (namespace, key, value, accessed) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, time.time())
+            )
+            self._count += 1
+
+    def _evict(self):
+        # Evict least recently used entries once the store is a batch past its cap, rather than on every write.
+        # The running count only sees this process's writes, so the real size is counted before deleting.
+        if self._count <= self.max_entries + self.evict_batch:
+            return
+        self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed ASC LIMIT ?)",
+                (excess,)
+            )
+            self._count = self.max_entries
+
+    def get(self, namespace, key):
+        with self._lock:
+            return self._get(namespace, key)
+
+    def get_many(self, namespace, keys):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                return [self._get(namespace, key) for key in keys]
+            finally:
+                self._conn.execute("COMMIT")
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._set(namespace, key, value)
+            self._evict()
+
+    def set_many(self, namespace, items):
+        # items: (key, value) pairs, written in one transaction
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, value in items:
+                    self._set(namespace, key, value)
+            finally:
+                self._conn.execute("COMMIT")
+            self._evict()
+
+    def get_text(self, namespace, key):
+        value = self.get(namespace, key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set_text(self, namespace, key, text):
+        self.set(namespace, key, text.encode("utf-8"))
+
+    def get_vector(self, namespace, key):
+        value = self.get(namespace, key)
+        return np.frombuffer(value, dtype=np.float32) if value is not None else None
+
+    def set_vector(self, namespace, key, vector):
+        self.set(namespace, key, np.asarray(vector, dtype=np.float32).tobytes())
+
+    def get_vectors(self, namespace, keys):
+        return [np.frombuffer(value, dtype=np.float32) if value is not None else None for value in self.get_many(namespace, keys)]
+
+    def set_vectors(self, namespace, items):
+        self.set_many(namespace, [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items])
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": size, "hits": dict(self.hits), "misses": dict(self.misses)}
+
+    def close(self):
+        self._conn.close()
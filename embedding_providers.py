@@ -0,0 +1,97 @@
+import os
+import asyncio
+import requests
+import numpy as np
+from dotenv import load_dotenv
+import llm_client
+from config import PROXY_BASE_URL, EMBEDDING_BACKEND, EMBEDDING_MODELS, LOCAL_EMBEDDING_MODEL_DIR, LOCAL_EMBEDDING_MAX_TOKENS
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+except ImportError:
+    onnxruntime = None
+    Tokenizer = None
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+
+# -------------------- Remote (OpenAI-compatible proxy) --------------------
+class RemoteEmbeddingProvider:
+    name = "remote"
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed(self, texts):
+        # Blocking call, for the offline data pipelines
+        headers = {
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model,
+            "input": texts
+        }
+        response = requests.post(f"{PROXY_BASE_URL}/embeddings", headers=headers, json=payload)
+        response.raise_for_status()
+        return [item["embedding"] for item in response.json()["data"]]
+
+    async def aembed(self, texts):
+        # Goes through the API server's shared connection pool
+        return await llm_client.create_embeddings({"model": self.model, "input": texts})
+
+
+# -------------------- Local (ONNX sentence-embedding model on CPU) --------------------
+class LocalEmbeddingProvider:
+    # Expects a sentence-transformers model exported to ONNX: <model_dir>/model.onnx and tokenizer.json
+    name = "local"
+
+    def __init__(self, model, model_dir=LOCAL_EMBEDDING_MODEL_DIR, max_tokens=LOCAL_EMBEDDING_MAX_TOKENS):
+        if onnxruntime is None:
+            raise ImportError("The local embedding backend needs `pip install onnxruntime tokenizers`")
+        self.model = model
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        token_vectors = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+        # Mean-pool the token vectors over the real (unpadded) tokens
+        mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+        vectors = (token_vectors * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32).tolist()
+
+    async def aembed(self, texts):
+        # A few milliseconds of CPU work; run it off the event loop all the same
+        return await asyncio.to_thread(self.embed, texts)
+
+
+EMBEDDING_PROVIDERS = {
+    "remote": RemoteEmbeddingProvider,
+    "local": LocalEmbeddingProvider,
+}
+
+_providers = {}
+
+
+def get_embedding_provider(name=EMBEDDING_BACKEND):
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding backend {name!r}, expected one of {sorted(EMBEDDING_PROVIDERS)}")
+    if name not in _providers:
+        _providers[name] = EMBEDDING_PROVIDERS[name](EMBEDDING_MODELS[name])
+    return _providers[name]
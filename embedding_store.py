@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def store_paths(store_path):
+    return store_path + ".npy", store_path + ".manifest.json"
+
+
+def backend_store_path(store_path, backend):
+    # The remote store keeps its original name; other embedding backends get their own files beside it
+    return store_path if backend == "remote" else f"{store_path}.{backend}"
+
+
+# -------------------- Write --------------------
+def save_embedding_store(store_path, embeddings, texts, model, backend="remote"):
+    matrix_path, manifest_path = store_paths(store_path)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if len(matrix) != len(texts):
+        raise ValueError(f"{len(matrix)} embeddings for {len(texts)} texts")
+
+    # Rows are stored unit-length so search is a plain dot product straight off the mapped file
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+
+    row_hashes = [text_hash(t) for t in texts]
+    manifest = {
+        "format_version": STORE_FORMAT_VERSION,
+        "backend": backend,
+        "model": model,
+        "dtype": str(matrix.dtype),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "rows": len(row_hashes),
+        "normalized": True,
+        "content_hash": hashlib.sha256("".join(row_hashes).encode("utf-8")).hexdigest()[:16],
+        "row_hashes": row_hashes,
+    }
+
+    # Write to temp files first so a crash never leaves a half-written store behind. The temp names are
+    # per process: several uvicorn workers starting without a store all build and save it at once.
+    os.makedirs(os.path.dirname(matrix_path) or ".", exist_ok=True)
+    suffix = f".{os.getpid()}.tmp"
+    with open(matrix_path + suffix, "wb") as f:
+        np.save(f, matrix)
+    with open(manifest_path + suffix, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(matrix_path + suffix, matrix_path)
+    os.replace(manifest_path + suffix, manifest_path)
+    print(f"[INFO] Saved {manifest['rows']} x {manifest['dim']} {manifest['dtype']} {backend}/{model} embeddings to {matrix_path}")
+    return manifest
+
+
+# -------------------- Read --------------------
+def load_manifest(store_path):
+    _, manifest_path = store_paths(store_path)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def store_version(store_path):
+    # Identifies a store's vectors without reading them: which texts were embedded, by which backend and model
+    manifest = load_manifest(store_path)
+    if manifest is None:
+        return None
+    return f"{manifest.get('backend', 'remote')}/{manifest['model']}/{manifest['dtype']}/{manifest['content_hash']}"
+
+
+def load_embedding_store(store_path, texts=None, model=None, backend=None):
+    matrix_path, _ = store_paths(store_path)
+    manifest = load_manifest(store_path)
+    if manifest is None or not os.path.exists(matrix_path):
+        return None, None
+    if manifest.get("format_version") != STORE_FORMAT_VERSION:
+        print(f"[INFO] Ignoring embedding store {matrix_path} with unknown format")
+        return None, None
+    # Stores written before backends were recorded all came from the remote API
+    if backend is not None and manifest.get("backend", "remote") != backend:
+        print(f"[INFO] Embedding store {matrix_path} was built by the {manifest.get('backend', 'remote')} backend, not {backend}")
+        return None, None
+    if model is not None and manifest["model"] != model:
+        print(f"[INFO] Embedding store {matrix_path} was built with {manifest['model']}, not {model}")
+        return None, None
+    if texts is not None and manifest["row_hashes"] != [text_hash(t) for t in texts]:
+        print(f"[INFO] Embedding store {matrix_path} is out of date with its records")
+        return None, None
+
+    matrix = np.load(matrix_path, mmap_mode="r")
+    return matrix, manifest
+
+
+# -------------------- Incremental Embedding --------------------
+def embed_in_batches(texts, embed_batch, max_chars_per_batch=10000):
+    embeddings = []
+    current_batch, current_char_count = [], 0
+    batch_num = 0
+    for text in texts:
+        if current_batch and current_char_count + len(text) > max_chars_per_batch:
+            print(f"[INFO] Sending batch {batch_num} with {len(current_batch)} texts ({current_char_count} chars)")
+            embeddings.extend(embed_batch(current_batch))
+            current_batch, current_char_count = [], 0
+            batch_num += 1
+        current_batch.append(text)
+        current_char_count += len(text)
+    if current_batch:
+        print(f"[INFO] Sending final batch {batch_num} with {len(current_batch)} texts ({current_char_count} chars)")
+        embeddings.extend(embed_batch(current_batch))
+    return embeddings
+
+
+def sync_embedding_store(store_path, texts, model, embed_batch, max_chars_per_batch=10000, backend="remote"):
+    stored, manifest = load_embedding_store(store_path, model=model, backend=backend)
+    row_hashes = [text_hash(t) for t in texts]
+    # Stores written in float16 are rewritten as float32 from their own rows: searching a half-precision
+    # matrix upcasts all of it on every query, which is slower and uses more memory than float32
+    if manifest is not None and manifest["row_hashes"] == row_hashes and manifest["dtype"] == "float32":
+        print(f"[INFO] Loading cached embeddings from {store_path}.npy")
+        return stored
+
+    # Rows are matched on the hash of the text that was embedded, so edits and reorders are picked up too
+    reusable = {h: i for i, h in enumerate(manifest["row_hashes"])} if manifest is not None else {}
+    pending = {}
+    for h, text in zip(row_hashes, texts):
+        if h not in reusable:
+            pending.setdefault(h, text)
+    dropped = len(set(reusable) - set(row_hashes))
+    print(f"[INFO] Reusing {len(texts) - sum(h in pending for h in row_hashes)} embeddings, "
+          f"embedding {len(pending)} new or changed texts, dropping {dropped}")
+
+    new_vectors = dict(zip(pending, embed_in_batches(list(pending.values()), embed_batch, max_chars_per_batch)))
+    if manifest is not None:
+        dim = manifest["dim"]
+    else:
+        dim = len(next(iter(new_vectors.values()))) if new_vectors else 0
+    matrix = np.empty((len(texts), dim), dtype=np.float32)
+    for i, h in enumerate(row_hashes):
+        matrix[i] = new_vectors[h] if h in new_vectors else stored[reusable[h]]
+    # Release the old mapping before the store files are replaced underneath it
+    del stored
+
+    save_embedding_store(store_path, matrix, texts, model, backend)
+    return load_embedding_store(store_path)[0]
@@ -5,13 +5,14 @@ from course_content.scrape_data import scrape_tds_data
 from course_content.process_data import process_tds_data
 
 
-# Fetch, filter, and process discourse data.
-scrape_data()
-filter_data()
-process_data()
-
-
-# Fetch, filter, and process course data.
-scrape_tds_data()
-process_tds_data()
+# filter_data runs OCR in worker processes: under the spawn start method (Windows, macOS) each
+# worker re-imports this module, so the pipeline must only run when the script itself is executed
+if __name__ == "__main__":
+    # Fetch, filter, and process discourse data.
+    scrape_data()
+    filter_data()
+    process_data()
 
+    # Fetch, filter, and process course data.
+    scrape_tds_data()
+    process_tds_data()
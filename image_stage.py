@@ -0,0 +1,119 @@
+import base64
+import binascii
+import math
+from io import BytesIO
+import pytesseract
+from PIL import Image, ImageChops, features
+from discourse_content.ocr_stage import ocr_image_lines
+from config import IMAGE_MAX_PIXELS, IMAGE_CROP_TOLERANCE, IMAGE_CROP_PADDING, IMAGE_ENCODE_FORMAT, IMAGE_ENCODE_QUALITY
+
+# Formats the vision endpoint accepts as they are
+VISION_FORMATS = {"PNG", "JPEG", "WEBP", "GIF"}
+
+_tesseract_available = True
+
+
+# -------------------- Decode --------------------
+def decode_image(image_data):
+    # Accepts plain base64 or a data URL; returns (raw bytes, Pillow image with its real format)
+    if image_data.startswith("data:") and "," in image_data:
+        image_data = image_data.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(image_data)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"image is not valid base64: {e}")
+    image = Image.open(BytesIO(raw))
+    image.load()
+    return raw, image
+
+
+# -------------------- Crop / Downscale --------------------
+def crop_margins(image, tolerance=IMAGE_CROP_TOLERANCE, padding=IMAGE_CROP_PADDING):
+    # Trim the uniform border a full-screen screenshot usually has around the content,
+    # taking the top-left pixel as the background colour
+    rgb = image.convert("RGB")
+    background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+    mask = ImageChops.difference(rgb, background).convert("L").point(lambda v: 255 if v > tolerance else 0)
+    box = mask.getbbox()
+    if box is None:
+        return image
+    left, top, right, bottom = box
+    box = (max(0, left - padding), max(0, top - padding), min(image.width, right + padding), min(image.height, bottom + padding))
+    if box == (0, 0, image.width, image.height):
+        return image
+    return image.crop(box)
+
+
+def fit_pixel_budget(image, max_pixels=IMAGE_MAX_PIXELS):
+    scale = math.sqrt(max_pixels / (image.width * image.height))
+    if scale >= 1:
+        return image
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+# -------------------- Re-encode --------------------
+def encode_image(image, fmt=IMAGE_ENCODE_FORMAT, quality=IMAGE_ENCODE_QUALITY):
+    if fmt == "WEBP" and not features.check("webp"):
+        fmt = "PNG"
+    has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+    if fmt == "JPEG" or not has_alpha:
+        image = image.convert("RGB")
+    else:
+        image = image.convert("RGBA")
+    if fmt == "PNG":
+        options = [{"optimize": True}]
+    elif fmt == "WEBP":
+        # Lossless is far smaller (and sharper) for text on flat backgrounds, lossy for photos: keep the smaller
+        options = [{"lossless": True}, {"quality": quality}]
+    else:
+        options = [{"quality": quality}]
+    encodings = []
+    for option in options:
+        buffer = BytesIO()
+        image.save(buffer, format=fmt, **option)
+        encodings.append(buffer.getvalue())
+    return min(encodings, key=len), Image.MIME[fmt]
+
+
+def prepare_image(image_data):
+    # Returns {"image": cropped full-resolution image for Tesseract, "mime", "base64": what the vision call gets}
+    raw, image = decode_image(image_data)
+    original_format = image.format
+    cropped = crop_margins(image)
+    resized = fit_pixel_budget(cropped)
+    encoded, mime = encode_image(resized)
+    # A small, already compact image can come out bigger: then the original is sent as it is
+    if resized is image and original_format in VISION_FORMATS and len(raw) <= len(encoded):
+        encoded, mime = raw, Image.MIME[original_format]
+    print(
+        f"[INFO] Screenshot {original_format} {image.width}x{image.height} ({len(raw)} bytes) -> "
+        f"{mime} {resized.width}x{resized.height} ({len(encoded)} bytes)"
+    )
+    return {
+        "image": cropped,
+        "mime": mime,
+        "base64": base64.b64encode(encoded).decode("ascii"),
+    }
+
+
+# -------------------- Local OCR --------------------
+def local_ocr(image, min_words=0, min_confidence=0):
+    # Tesseract text, or None when it isn't installed or isn't sure enough of what it read
+    global _tesseract_available
+    if not _tesseract_available:
+        return None
+    try:
+        text, confidence, words = ocr_image_lines(image)
+    except pytesseract.TesseractNotFoundError as e:
+        _tesseract_available = False
+        print(f"[WARN] Tesseract not found, using the vision model for screenshots: {e}")
+        return None
+    except Exception as e:
+        print(f"[WARN] Tesseract failed: {e}")
+        return None
+    if words < min_words or confidence < min_confidence:
+        print(f"[INFO] Tesseract read {words} words at {confidence:.0f}% confidence, using the vision model")
+        return None
+    print(f"[INFO] Tesseract read {words} words at {confidence:.0f}% confidence")
+    return text
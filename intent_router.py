@@ -0,0 +1,168 @@
+import re
+import numpy as np
+from course_content.content_filtered import course_content
+
+COURSE_PAGE = "Course Page"
+
+# -------------------- Response Templates --------------------
+# Fixed answers for the course_related prompt's logistics rules, from the same course metadata
+TEMPLATES = {
+    "deadline": "Sorry, I don't have access to specific dates or deadlines.",
+    "grading": (
+        "The course has 7 graded assignments (the best 4 count for 15%), 2 projects (20% each), "
+        "a remote exam (20%) and an in-person final exam (25%). Grading combines automated and LLM evaluation."
+    ),
+    "exam_format": (
+        "The projects and the remote exam are open-internet. The final exam is in-person and closed-book."
+    ),
+    "workload": (
+        "This course is hard and time-intensive: it has a high failure rate and grading can be unpredictable, "
+        "so plan your time and start the assignments early."
+    ),
+    "portal": "You can find and submit the graded assignments on the assignment portal.",
+}
+TEMPLATE_TOPICS = {
+    "deadline": COURSE_PAGE,
+    "grading": COURSE_PAGE,
+    "exam_format": COURSE_PAGE,
+    "workload": COURSE_PAGE,
+    "portal": "Assignment Portal",
+}
+
+# -------------------- Keyword / Regex Rules --------------------
+# Anchored to short logistics phrasings: a bare "extension" or "calculated" is just as likely
+# to be a technical question about the course tools, which has to go through retrieval
+ASSESSMENT = r"(ga\s?\d+|graded assignments?|assignments?|projects?|(final |remote |end[- ]term )?exams?|end[- ]term|roe|quiz(zes)?|sessions?|results?)( \d+)?"
+INTENT_RULES = {
+    "deadline": [
+        r"^(what|when|which) (is|are|was) (the |our |my )?(\w+ ){0,3}(deadlines?|due dates?|last date|cut-?off date)\b",
+        r"^(is|has|was|will) (the |our |my )?(\w+ ){0,3}(deadlines?|due dates?|last date|submission date)( for [\w ]+?)?( been| be)? (extended|changed|postponed)\b",
+        r"^(can|could|will|may) (i|we) (get|have|request) an? extension\b",
+        rf"^when (is|are|will|does|do) (the |our |my )?(next )?{ASSESSMENT}( be)? (due|held|scheduled|conducted|released|open|close|start|end)\b",
+        rf"^when (is|are) (the |our |my )?(next )?{ASSESSMENT}\s*\??$",
+        rf"^(on )?(what|which) (date|day) (is|are|will)\b.*\b({ASSESSMENT}|deadlines?)\b",
+        r"^till when (can|do|should) (i|we) submit\b",
+    ],
+    "grading": [
+        rf"^(what|how) (is|are) (the )?(grading (policy|scheme|criteria)|weightage|marks? distribution|passing (marks|criteria|score))( (of|for|in) (the |each |this )?({ASSESSMENT}|course|tds)\b.*)?\s*\??$",
+        rf"^how (many|much) marks (is|are|does|do|will) (the |each |a )?({ASSESSMENT}|course)\b",
+        r"^(are|is|do|does|will) (only )?(the )?best (4|four)\b",
+        rf"^how (is|are|will) (the |my |our )?(final |overall |course )?(grades?|marks|scores?|course|{ASSESSMENT})( be)? (graded|evaluated|calculated|scored|weighted)\b",
+    ],
+    "exam_format": [
+        r"\b(open[- ]book|closed[- ]book|open[- ]internet)\b",
+        r"\b(is|are) (the )?(final |remote |end[- ]term )?exams? (online|offline|in[- ]person|proctored)\b",
+    ],
+    "workload": [
+        r"^how (hard|difficult|tough) is (this|the|tds)( course)?\s*\??$",
+        r"\b(workload|time commitment|hours (a|per) week|fail(ure)? rate)\b",
+    ],
+    "portal": [
+        r"\b(assignment|submission) (portal|link|page)\b",
+        r"\bwhere (do|can|should) i (submit|find) (the |my )?(graded )?assignments?\b",
+    ],
+}
+INTENT_PATTERNS = {intent: [re.compile(p) for p in patterns] for intent, patterns in INTENT_RULES.items()}
+# Questions about one assignment question follow that question's own instructions (rule 6), not a template
+SPECIFIC_QUESTION_RE = re.compile(r"\b(q|question)\s*\d+\b")
+
+# Labelled phrasings for nearest-centroid matching, for questions the rules don't catch word for word
+INTENT_EXAMPLES = {
+    "deadline": [
+        "When is the assignment due?",
+        "What is the last date to submit the project?",
+        "Till when can I submit GA3?",
+        "Has the submission date been extended?",
+        "When will the end term exam be held?",
+    ],
+    "grading": [
+        "How is the final grade calculated?",
+        "How much do the assignments count towards the total?",
+        "What is the weightage of the projects and exams?",
+        "How many graded assignments are considered for the score?",
+        "How are marks awarded in this course?",
+    ],
+    "exam_format": [
+        "Can I use the internet during the exam?",
+        "Is the final exam open book?",
+        "Do we have to write the end term in person?",
+        "Are we allowed to use ChatGPT in the remote exam?",
+    ],
+    "workload": [
+        "Is this course very difficult?",
+        "How much time should I spend on this course every week?",
+        "Can I take this course along with three others?",
+        "Do many students fail this course?",
+    ],
+    "portal": [
+        "Where do I submit my assignments?",
+        "Where can I find the graded assignment questions?",
+        "Which website has the assignments?",
+        "Link to the exam portal for assignments",
+    ],
+}
+
+# -------------------- Topic -> URL --------------------
+# course_shrinked titles whose course_content key is spelled differently
+TOPIC_ALIASES = {
+    "vs code": "vc code",
+    "podman": "podmon",
+}
+TOPIC_URLS = {key.lower(): url for key, url in course_content.items()}
+
+
+def topic_url(topic):
+    key = str(topic).strip().lower()
+    return TOPIC_URLS.get(TOPIC_ALIASES.get(key, key))
+
+
+# -------------------- Intent Router --------------------
+class IntentRouter:
+    def __init__(self, max_words=30, centroid_threshold=0.75, centroid_margin=0.05):
+        self.max_words = max_words
+        self.centroid_threshold = centroid_threshold
+        self.centroid_margin = centroid_margin
+        self.labels = []
+        self.centroids = None
+
+    def fit(self, example_embeddings):
+        # example_embeddings: intent -> embeddings of its INTENT_EXAMPLES, in the same space as the questions
+        self.labels = list(example_embeddings)
+        centroids = []
+        for label in self.labels:
+            vectors = np.asarray(example_embeddings[label], dtype=np.float32)
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            centroids.append(vectors.mean(axis=0))
+        centroids = np.array(centroids, dtype=np.float32)
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def eligible(self, text):
+        return len(text.split()) <= self.max_words and not SPECIFIC_QUESTION_RE.search(text.lower())
+
+    def match_rules(self, text):
+        # Returns (intent, topic) or None
+        if not self.eligible(text):
+            return None
+        lowered = re.sub(r"\s+", " ", text.lower()).strip()
+        for intent, patterns in INTENT_PATTERNS.items():
+            if any(p.search(lowered) for p in patterns):
+                return intent, TEMPLATE_TOPICS[intent]
+        return None
+
+    def match_embedding(self, text, embedding):
+        if self.centroids is None or embedding is None or not self.eligible(text):
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.centroids @ (query / np.linalg.norm(query))
+        order = np.argsort(-scores)
+        best = order[0]
+        runner_up = scores[order[1]] if len(order) > 1 else -1.0
+        if scores[best] < self.centroid_threshold or scores[best] - runner_up < self.centroid_margin:
+            return None
+        intent = self.labels[best]
+        return intent, TEMPLATE_TOPICS[intent]
+
+    @staticmethod
+    def respond(intent, topic):
+        # Same shape as a course_related reply
+        return {"answer": TEMPLATES[intent], "topic": topic}
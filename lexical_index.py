@@ -0,0 +1,132 @@
+import re
+import math
+from collections import Counter, defaultdict
+import numpy as np
+
+# Keeps flags, versions, addresses and paths whole: "--host", "0.0.0.0", "ga5", "uv.lock", "/api/"
+TOKEN_RE = re.compile(r"--?[a-z0-9][a-z0-9\-]*|[a-z0-9_]+(?:[.:/\-][a-z0-9_]+)*")
+PART_RE = re.compile(r"[a-z0-9_]{2,}")
+SEPARATORS = re.compile(r"[.:/\-]")
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at", "for", "with", "by", "from",
+    "is", "are", "was", "were", "be", "been", "am", "do", "does", "did", "have", "has", "had",
+    "i", "me", "my", "we", "our", "you", "your", "it", "its", "this", "that", "these", "those",
+    "what", "which", "who", "how", "why", "when", "where", "can", "could", "should", "would", "will",
+    "not", "no", "so", "as", "there", "here", "any", "all", "please", "sir", "mam", "hi", "hello",
+}
+
+
+def tokenize(text):
+    words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+    tokens = list(words)
+    # Compound tokens also count as their parts, so "uv.lock" still matches "lock"
+    for word in words:
+        if SEPARATORS.search(word):
+            parts = PART_RE.findall(word)
+            if len(parts) > 1:
+                tokens.extend(p for p in parts if p not in STOPWORDS)
+    # Adjacent word pairs reward exact phrases like "uv run" or "ga5 q3"
+    tokens.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+def single_terms(tokens):
+    # Coverage is judged on single terms; the word pairs only sharpen the ranking
+    return {t for t in tokens if " " not in t}
+
+
+# -------------------- BM25 Inverted Index --------------------
+class BM25Index:
+    def __init__(self, texts, k1=1.2, b=0.75):
+        self.k1 = k1
+        docs = [tokenize(text) for text in texts]
+        self.n = len(docs)
+        lengths = np.array([len(d) for d in docs], dtype=np.float32)
+        average = float(lengths.mean()) if self.n and lengths.mean() > 0 else 1.0
+        # Per-document part of the BM25 denominator, computed once
+        self.length_norm = k1 * (1 - b + b * lengths / average)
+
+        doc_ids, tfs = defaultdict(list), defaultdict(list)
+        for i, doc in enumerate(docs):
+            for term, tf in Counter(doc).items():
+                doc_ids[term].append(i)
+                tfs[term].append(tf)
+        self.postings = {
+            term: (np.array(ids, dtype=np.int64), np.array(tfs[term], dtype=np.float32))
+            for term, ids in doc_ids.items()
+        }
+        self.idf = {
+            term: math.log(1 + (self.n - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in self.postings.items()
+        }
+        # What a term the corpus has never seen would be worth
+        self.unseen_idf = math.log(1 + (self.n + 0.5) / 0.5)
+
+    def __len__(self):
+        return self.n
+
+    def scores(self, query_terms):
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in set(query_terms):
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            scores[ids] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.length_norm[ids])
+        return scores
+
+    def search(self, query, top_n=10, min_coverage=0.0):
+        return self._search(tokenize(query), top_n, min_coverage)
+
+    def _search(self, tokens, top_n, min_coverage=0.0):
+        scores = self.scores(tokens)
+        k = min(top_n, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        if min_coverage > 0:
+            terms = single_terms(tokens)
+            candidates = np.array([c for c in candidates if self.coverage(terms, c) >= min_coverage], dtype=np.int64)
+        return candidates, scores[candidates]
+
+    def coverage(self, terms, doc):
+        # Share of the query's idf weight whose terms appear in the document. Takes the query's
+        # single_terms, so a query is tokenized once however many candidates are checked.
+        if not terms:
+            return 0.0
+        total = sum(self.idf.get(t, self.unseen_idf) for t in terms)
+        covered = sum(self.idf[t] for t in terms if t in self.postings and self._contains(t, doc))
+        return covered / total
+
+    def decisive_match(self, query, min_coverage=0.8, min_margin=1.5):
+        # The best document is decisive when it holds nearly all of the query's weight
+        # and clearly outscores the runner-up
+        tokens = tokenize(query)
+        terms = single_terms(tokens)
+        if len(terms) < 2:
+            return None
+        indices, scores = self._search(tokens, top_n=2)
+        if len(indices) == 0 or self.coverage(terms, int(indices[0])) < min_coverage:
+            return None
+        if len(scores) > 1 and scores[0] < min_margin * scores[1]:
+            return None
+        return int(indices[0])
+
+    def _contains(self, term, doc):
+        # Posting lists are in document order
+        ids = self.postings[term][0]
+        pos = int(np.searchsorted(ids, doc))
+        return pos < len(ids) and ids[pos] == doc
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    # rankings: lists of document ids, best first. Returns (ids, fused scores), best first.
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[int(doc)] += 1.0 / (k + rank + 1)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])
+    return (
+        np.array([doc for doc, _ in ordered], dtype=np.int64),
+        np.array([score for _, score in ordered], dtype=np.float32),
+    )
@@ -0,0 +1,93 @@
+import os
+import json
+import asyncio
+import httpx
+from dotenv import load_dotenv
+from metrics import record_upstream_error
+from config import (
+    PROXY_BASE_URL, HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, LLM_MAX_CONCURRENCY
+)
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+_client = None
+_semaphore = None
+
+
+# -------------------- Shared Client Lifecycle --------------------
+def get_client():
+    global _client, _semaphore
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=PROXY_BASE_URL,
+            headers={
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _client
+
+
+async def close_client():
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+
+# -------------------- Proxy Calls --------------------
+async def post_json(path, payload):
+    client = get_client()
+    async with _semaphore:
+        try:
+            response = await client.post(path, json=payload)
+        except httpx.TransportError as e:
+            record_upstream_error(path, type(e).__name__)
+            raise
+    if response.status_code >= 400:
+        record_upstream_error(path, response.status_code)
+    return response
+
+
+async def chat_completion(payload):
+    return await post_json("/chat/completions", payload)
+
+
+async def create_embeddings(payload):
+    response = await post_json("/embeddings", payload)
+    response.raise_for_status()
+    return [item["embedding"] for item in response.json()["data"]]
+
+
+async def stream_chat_completion(payload):
+    # Yields the content deltas of an upstream streaming (SSE) chat completion
+    client = get_client()
+    async with _semaphore:
+        try:
+            async with client.stream("POST", "/chat/completions", json={**payload, "stream": True}) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    record_upstream_error("/chat/completions", response.status_code)
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except httpx.TransportError as e:
+            record_upstream_error("/chat/completions", type(e).__name__)
+            raise
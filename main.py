@@ -1,23 +1,81 @@
-import os
+import asyncio
 import numpy as np
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from discourse_content.process_data import find_similar_questions_later
-from course_content.process_data import find_similar_questions_later_tds
-from course_content.content_filtered import course_content, course_shrinked, other_covered
-import requests
+from discourse_content.process_data import load_discourse_index
+from course_content.process_data import load_tds_index
+from course_content.content_filtered import course_shrinked
+from intent_router import IntentRouter, INTENT_EXAMPLES, topic_url
+from prompts import (
+    TopicSelector, load_token_encoding, count_tokens, count_message_tokens,
+    discourse_messages, tds_content_messages, course_messages
+)
+import httpx
+import llm_client
+from embedding_providers import get_embedding_provider
+from image_stage import prepare_image, local_ocr
+from metrics import span, record_answer, render_metrics, RequestMetricsMiddleware
+from answer_stream import JSONAnswerStream, sse_event
+from answer_cache import AnswerCache, make_cache_key
+from disk_cache import DiskCache, content_key
+from config import (
+    ANSWER_MODE, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY,
+    QUERY_CACHE_PATH, QUERY_CACHE_MAX_ENTRIES, BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY,
+    DISCOURSE_TOP_K, DISCOURSE_THRESHOLD, DISCOURSE_CONTEXT_TOKENS,
+    COURSE_TOP_K, COURSE_THRESHOLD, COURSE_CONTEXT_TOKENS, CONTEXT_DEDUPE_SIMILARITY,
+    LEXICAL_SKIP_EMBEDDING, LEXICAL_DECISIVE_COVERAGE, LEXICAL_DECISIVE_MARGIN,
+    INTENT_FAST_PATH, INTENT_MAX_WORDS, INTENT_CENTROID_THRESHOLD, INTENT_CENTROID_MARGIN,
+    COURSE_PROMPT_TOPICS, IMAGE_OCR_MODE, IMAGE_TESSERACT_MIN_WORDS, IMAGE_TESSERACT_MIN_CONFIDENCE,
+    IMAGE_OCR_MAX_TOKENS, IMAGE_QUERY_MODE, IMAGE_OCR_EMBEDDING_WEIGHT
+)
 import json
 import re
 from fastapi.middleware.cors import CORSMiddleware
 
 # Load environment variables
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GPT_MODEL = "gpt-4o-mini"
 
+answer_cache = AnswerCache(
+    max_size=ANSWER_CACHE_SIZE,
+    ttl=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY
+)
+query_cache = DiskCache(QUERY_CACHE_PATH, max_entries=QUERY_CACHE_MAX_ENTRIES)
+intent_router = IntentRouter(
+    max_words=INTENT_MAX_WORDS,
+    centroid_threshold=INTENT_CENTROID_THRESHOLD,
+    centroid_margin=INTENT_CENTROID_MARGIN
+)
+topic_selector = TopicSelector(course_shrinked, top_n=COURSE_PROMPT_TOPICS)
+
+# Load the retrieval indexes once and keep them resident for every request
+@asynccontextmanager
+async def lifespan(app):
+    print("[INFO] Loading retrieval indexes...")
+    app.state.discourse_index = load_discourse_index()
+    app.state.tds_index = load_tds_index()
+    print(f"[INFO] Indexed {len(app.state.discourse_index)} discourse and {len(app.state.tds_index)} course records")
+    # Answers cached against an older build of the corpora are stale
+    answer_cache.reset(version=f"{app.state.discourse_index.version}:{app.state.tds_index.version}")
+    llm_client.get_client()
+    await asyncio.to_thread(load_token_encoding)
+    # Loads the local embedding model up front, if that backend is configured
+    get_embedding_provider()
+    if INTENT_FAST_PATH:
+        await fit_intent_centroids()
+    if COURSE_PROMPT_TOPICS:
+        await fit_topic_embeddings()
+    yield
+    await llm_client.close_client()
+
+
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,12 +84,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 
 # Request body model
 class QueryRequest(BaseModel):
     question: str
-    image: str = None  # optional base64 screenshot
+    image: Optional[str] = None  # optional base64 screenshot
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[QueryRequest]
+    stream: bool = False  # stream answers back as NDJSON as they finish
 
 
 # Health check endpoint
@@ -40,15 +104,45 @@ async def root():
     return {"status": "TDS Virtual TA API is running 🚀"}
 
 
-def get_ocr(image_data):
-    # Construct the data URL for the image
-    data_url = f"data:image/webp;base64,{image_data}"
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: stage/request latency histograms, answers by stage, cache and upstream errors
+    cache_stats = [("answer", kind, answer_cache.hits[kind], answer_cache.misses[kind]) for kind in ("exact", "semantic")]
+    query_stats = await asyncio.to_thread(query_cache.stats)
+    for namespace in sorted(set(query_stats["hits"]) | set(query_stats["misses"])):
+        cache_stats.append((
+            "query", namespace, query_stats["hits"].get(namespace, 0), query_stats["misses"].get(namespace, 0)
+        ))
+    return PlainTextResponse(render_metrics(cache_stats), media_type="text/plain; version=0.0.4")
 
-    # Prepare the headers for the API request
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
+
+async def get_ocr(image_data):
+    cache_key = content_key(image_data)
+    # SQLite reads and writes run in a thread, off the event loop
+    cached = await asyncio.to_thread(query_cache.get_text, "ocr", cache_key)
+    if cached is not None:
+        print("[INFO] Using cached OCR text")
+        return cached
+
+    # Decoding, cropping and re-encoding are CPU work: keep them off the event loop
+    try:
+        with span("image_prepare"):
+            prepared = await asyncio.to_thread(prepare_image, image_data)
+    except Exception as e:
+        print(f"[WARN] Could not read the screenshot: {e}")
+        return None
+
+    if IMAGE_OCR_MODE != "vision":
+        # In auto mode Tesseract's text is only kept for screenshots it reads confidently
+        minimums = (IMAGE_TESSERACT_MIN_WORDS, IMAGE_TESSERACT_MIN_CONFIDENCE) if IMAGE_OCR_MODE == "auto" else (0, 0)
+        with span("ocr_tesseract"):
+            extracted_text = await asyncio.to_thread(local_ocr, prepared["image"], *minimums)
+        if extracted_text is not None:
+            await asyncio.to_thread(query_cache.set_text, "ocr", cache_key, extracted_text)
+            return extracted_text
+
+    # Construct the data URL for the image
+    data_url = f"data:{prepared['mime']};base64,{prepared['base64']}"
 
     # Prepare the payload for the API request
     payload = {
@@ -70,104 +164,121 @@ def get_ocr(image_data):
                 ]
             }
         ],
-        "max_tokens": 200
+        "max_tokens": IMAGE_OCR_MAX_TOKENS
     }
 
     # Send the POST request to the OpenAI API
-    response = requests.post(
-        "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions",
-        headers=headers,
-        data=json.dumps(payload)
-    )
+    with span("llm_ocr"):
+        response = await llm_client.chat_completion(payload)
 
     # Check if the request was successful
     if response.status_code == 200:
         result = response.json()
         extracted_text = result['choices'][0]['message']['content']
+        await asyncio.to_thread(query_cache.set_text, "ocr", cache_key, extracted_text)
         return extracted_text
     else:
         print(f"Request failed with status code {response.status_code}: {response.text}")
         return None
 
 
-def compute_embedding(user_question):
-    cleaned = user_question.strip()[:2000]
-
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "text-embedding-3-small",
-        "input": [cleaned]
-    }
+async def compute_embeddings(user_questions):
+    provider = get_embedding_provider()
+    cleaned = [q.strip()[:2000] for q in user_questions]
+    cache_keys = [content_key(provider.model, c) for c in cleaned]
+    embeddings = await asyncio.to_thread(query_cache.get_vectors, "embedding", cache_keys)
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+    if len(missing) < len(cleaned):
+        print(f"[INFO] Using {len(cleaned) - len(missing)} cached question embeddings")
+
+    # Group uncached questions into batches under the same character budget as get_cached_embeddings
+    max_chars_per_batch = 10000
+    batches, current_batch, current_char_count = [], [], 0
+    for i in missing:
+        if current_batch and current_char_count + len(cleaned[i]) > max_chars_per_batch:
+            batches.append(current_batch)
+            current_batch, current_char_count = [], 0
+        current_batch.append(i)
+        current_char_count += len(cleaned[i])
+    if current_batch:
+        batches.append(current_batch)
+
+    async def embed_batch(batch):
+        print(f"[INFO] Computing {provider.name} embeddings for {len(batch)} questions, starting with: {cleaned[batch[0]][:60]}...")
+        with span("embedding"):
+            vectors = await provider.aembed([cleaned[i] for i in batch])
+        for i, embedding in zip(batch, vectors):
+            embeddings[i] = embedding
+        await asyncio.to_thread(query_cache.set_vectors, "embedding", [(cache_keys[i], embeddings[i]) for i in batch])
+
+    await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    return np.array(embeddings, dtype=np.float32)
+
+
+async def compute_embedding(user_question):
+    return (await compute_embeddings([user_question]))[0]
+
+
+def parse_llm_reply(reply_content, fallback):
+    with span("parse"):
+        # Attempt to extract JSON if it's inside a markdown code block
+        match = re.search(r"```json\s*(.*?)\s*```", reply_content, re.DOTALL)
+        if match:
+            reply_content = match.group(1)
 
-    print(f"[INFO] Computing embedding for question: {cleaned[:60]}...")
-    response = requests.post("https://aiproxy.sanand.workers.dev/openai/v1/embeddings", headers=headers, json=payload)
-    response.raise_for_status()
-    embedding = response.json()["data"][0]["embedding"]
+        try:
+            return json.loads(reply_content)
+        except json.JSONDecodeError:
+            return {"answer": reply_content.strip(), **fallback}
 
-    return np.array(embedding)
 
+def log_prompt_size(name, payload):
+    print(f"[INFO] {name} prompt: {count_message_tokens(payload['messages'])} tokens")
 
-def discourse_related(user_query, context):
-    system_prompt = f"""
-        You are a professor for the IIT Madras course 'Tools in Data Science'. A student has asked a question.
-        Below are up to 3 similar questions along with their corresponding answers from past interactions.
 
-        Your task:
-        1. Carefully read the student's question and the provided similar questions and answers.
-        2. If any of the similar Q&A pairs are helpful, use them to write a clear, accurate, and helpful answer to the student's question. Use same analogies or metaphors given in the answers.
-        3. Indicate which of the similar questions (1, 2, or 3) was most helpful in forming your answer.
-        4. If none of the provided Q&A pairs are relevant or helpful, respond with:
-           {{ "answer": "error", "relevant": "error" }}
+def discourse_payload(user_query, context):
+    payload = {
+        "model": GPT_MODEL,
+        # "temperature": 0.2,
+        "messages": discourse_messages(user_query, context)
+    }
+    log_prompt_size("discourse", payload)
+    return payload
 
-        Respond strictly in the following JSON format:
-        {{
-          "answer": "...",
-          "relevant": n  # where n is 1, 2, or 3, or "error" if none were useful
-        }}
 
-        context = {context}
-        """
-    system_prompt = system_prompt.lower()
-    user_query = user_query.lower()
+async def discourse_related(user_query, context):
+    payload = discourse_payload(user_query, context)
+    with span("llm_discourse"):
+        response = await llm_client.chat_completion(payload)
 
-    url = "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions"
+    if response.status_code == 200:
+        reply_content = response.json()["choices"][0]["message"]["content"]
+        return parse_llm_reply(reply_content, {"relevant": "error"})
+    else:
+        return {
+            "answer": f"API error {response.status_code}: {response.text}",
+            "relevant": "error"
+        }
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
 
+def tds_content_payload(user_query, context):
     payload = {
         "model": GPT_MODEL,
         # "temperature": 0.2,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_query}
-        ]
+        "messages": tds_content_messages(user_query, context)
     }
+    log_prompt_size("course content", payload)
+    return payload
 
-    response = requests.post(url, headers=headers, json=payload)
 
-    if response.status_code == 200:
-        result = response.json()
-        reply_content = result["choices"][0]["message"]["content"]
-
-        # Attempt to extract JSON if it's inside a markdown code block
-        match = re.search(r"```json\s*(.*?)\s*```", reply_content, re.DOTALL)
-        if match:
-            reply_content = match.group(1)
+async def tds_content_related(user_query, context):
+    payload = tds_content_payload(user_query, context)
+    with span("llm_course_content"):
+        response = await llm_client.chat_completion(payload)
 
-        try:
-            parsed_json = json.loads(reply_content)
-            return parsed_json
-        except json.JSONDecodeError:
-            return {
-                "answer": reply_content.strip(),
-                "relevant": "error"
-            }
+    if response.status_code == 200:
+        reply_content = response.json()["choices"][0]["message"]["content"]
+        return parse_llm_reply(reply_content, {"relevant": "error"})
     else:
         return {
             "answer": f"API error {response.status_code}: {response.text}",
@@ -175,251 +286,597 @@ def discourse_related(user_query, context):
         }
 
 
-def tds_content_related(user_query, context):
-    system_prompt = f"""
-    You are a professor for the IIT Madras course 'Tools in Data Science'. A student has asked a question.
+def course_payload(user_query, data_embeddings=None):
+    payload = {
+        "model": GPT_MODEL,
+        # "temperature": 0.5,
+        # "top_p": 1,
+        "messages": course_messages(user_query, topic_selector.select(user_query, data_embeddings))
+    }
+    log_prompt_size("course", payload)
+    return payload
 
-    Below are up to 3 related context passages from course materials.
 
-    Your task:
-    1. Read the question and the context carefully.
-    2. If any context is relevant, use it to generate a clear, accurate, and helpful answer.
-    3. Specify which context (1, 2, or 3) was most helpful.
-    4. If none are relevant, return:
-       {{ "answer": "error", "relevant": "error" }}
+async def course_related(user_query, data_embeddings=None):
+    payload = course_payload(user_query, data_embeddings)
+    with span("llm_course_metadata"):
+        response = await llm_client.chat_completion(payload)
 
-    Respond *only* in this exact JSON format:
-    {{
-      "answer": "...",
-      "relevant": n  # where n is 1, 2, 3, or "error"
-    }}
+    if response.status_code == 200:
+        reply_content = response.json()["choices"][0]["message"]["content"]
+        return parse_llm_reply(reply_content, {"topic": "null"})
+    else:
+        return {
+            "answer": f"Error {response.status_code}: {response.text}",
+            "topic": "null"
+        }
 
-    context = {context}
-    """
 
-    system_prompt = system_prompt.lower()
-    user_query = user_query.lower()
+# -------------------- Answer Stages --------------------
+async def lexically_decisive(data):
+    # One record matching nearly all of the question's terms makes the embedding round trip unnecessary.
+    # BM25 scoring grows with the corpus, so it runs in a worker thread instead of on the event loop.
+    if not LEXICAL_SKIP_EMBEDDING:
+        return False
+
+    def check():
+        return any(
+            index.decisive_lexical_match(data, LEXICAL_DECISIVE_COVERAGE, LEXICAL_DECISIVE_MARGIN) is not None
+            for index in (app.state.discourse_index, app.state.tds_index)
+        )
+
+    with span("lexical_check"):
+        return await asyncio.to_thread(check)
+
+
+async def retrieve(data, data_embeddings):
+    # data_embeddings is None after a decisive lexical match: the BM25 ranking is used on its own
+    with span("retrieval_discourse"):
+        discourse_matches = await asyncio.to_thread(
+            app.state.discourse_index.search,
+            data_embeddings, DISCOURSE_TOP_K, DISCOURSE_THRESHOLD, CONTEXT_DEDUPE_SIMILARITY, query_text=data
+        )
+    with span("retrieval_course"):
+        tds_matches = await asyncio.to_thread(
+            app.state.tds_index.search,
+            data_embeddings, COURSE_TOP_K, COURSE_THRESHOLD, CONTEXT_DEDUPE_SIMILARITY, query_text=data
+        )
+    return discourse_matches, tds_matches
+
+
+async def retrieve_many(data, data_embeddings):
+    with span("retrieval_discourse"):
+        discourse_matches = await asyncio.to_thread(
+            app.state.discourse_index.search_many,
+            data_embeddings, DISCOURSE_TOP_K, DISCOURSE_THRESHOLD, CONTEXT_DEDUPE_SIMILARITY, query_texts=data
+        )
+    with span("retrieval_course"):
+        tds_matches = await asyncio.to_thread(
+            app.state.tds_index.search_many,
+            data_embeddings, COURSE_TOP_K, COURSE_THRESHOLD, CONTEXT_DEDUPE_SIMILARITY, query_texts=data
+        )
+    return discourse_matches, tds_matches
+
+
+def pack_contexts(matches, max_tokens, fields=("question", "answer")):
+    # Share the token budget between the matches: short ones are kept whole and the
+    # leftover is split evenly among the long ones, which get their longest field cut down.
+    # Trimmed matches are copies, so the links shown to the user keep the full text.
+    costs = [sum(count_tokens(match[f]) for f in fields) for match, _ in matches]
+    cap, remaining = None, max_tokens
+    for n, cost in enumerate(sorted(costs)):
+        share = remaining // (len(costs) - n)
+        if cost > share:
+            cap = share
+            break
+        remaining -= cost
+
+    packed = []
+    for (match, score), cost in zip(matches, costs):
+        if cap is not None and cost > cap:
+            longest = max(fields, key=lambda f: len(match[f]))
+            keep = max(0, len(match[longest]) - (cost - cap) * 4)
+            match = dict(match, **{longest: match[longest][:keep] + "....continued"})
+        packed.append((match, score))
+    return packed
+
+
+def chosen_match(llm_response, matches):
+    # The candidate the model says it used; anything unusable means none was relevant
+    try:
+        ques_num = int(llm_response.get("relevant"))
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= ques_num <= len(matches):
+        return None
+    return matches[ques_num - 1][0]
 
-    url = "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions"
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
+def discourse_answer(llm_response, matches):
+    answer_text = llm_response["answer"]
+    match = chosen_match(llm_response, matches)
+    if match is None:
+        return None
 
-    payload = {
-        "model": GPT_MODEL,
-        # "temperature": 0.2,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_query}
+    return {
+        "answer": answer_text,
+        "links": [
+            {
+                "url": match['url'],
+                "text": match['answer']
+            }
         ]
     }
 
-    response = requests.post(url, headers=headers, json=payload)
 
-    if response.status_code == 200:
-        result = response.json()
-        reply_content = result["choices"][0]["message"]["content"]
+def tds_answer(llm_response, matches):
+    answer_text = llm_response["answer"]
+    match = chosen_match(llm_response, matches)
+    if match is None:
+        return None
 
-        # Attempt to extract JSON if it's inside a markdown code block
-        match = re.search(r"```json\s*(.*?)\s*```", reply_content, re.DOTALL)
-        if match:
-            reply_content = match.group(1)
+    return {
+        "answer": answer_text,
+        "links": [
+            {
+                "url": match['url'],
+                "text": match['question']
+            }
+        ]
+    }
 
-        try:
-            parsed_json = json.loads(reply_content)
-            return parsed_json
-        except json.JSONDecodeError:
-            return {
-                "answer": reply_content.strip(),
-                "relevant": "error"
+
+def course_answer(course_response):
+    answer = course_response["answer"]
+    topic = course_response["topic"]
+    url = topic_url(topic) or "None"
+    return {
+        "answer": answer,
+        "links": [
+            {
+                "url": url,
+                "text": topic
             }
+        ]
+    }
+
+
+async def fit_intent_centroids():
+    # Example embeddings go through the same (disk-cached) path as questions
+    try:
+        texts = [text for examples in INTENT_EXAMPLES.values() for text in examples]
+        vectors = iter(await compute_embeddings(texts))
+        intent_router.fit({intent: [next(vectors) for _ in examples] for intent, examples in INTENT_EXAMPLES.items()})
+        print(f"[INFO] Fitted {len(INTENT_EXAMPLES)} intent centroids")
+    except Exception as e:
+        print(f"[WARN] Intent centroids unavailable, using keyword rules only: {e}")
+
+
+async def fit_topic_embeddings():
+    # Topic titles are embedded once, in the question space, so the course prompt only lists the nearest ones
+    try:
+        topic_selector.fit(await compute_embeddings(topic_selector.topics))
+        print(f"[INFO] Embedded {len(topic_selector.topics)} course topics")
+    except Exception as e:
+        print(f"[WARN] Topic embeddings unavailable, selecting course topics by shared terms: {e}")
+
+
+def fast_path_answer(query, data_embeddings=None):
+    # Logistics questions with a fixed answer skip retrieval and the LLM entirely.
+    # Keyword rules run before anything else; centroids once the question has been embedded.
+    if not INTENT_FAST_PATH or query.image:
+        return None
+    if data_embeddings is None:
+        match = intent_router.match_rules(query.question)
     else:
-        return {
-            "answer": f"API error {response.status_code}: {response.text}",
-            "relevant": "error"
-        }
+        match = intent_router.match_embedding(query.question, data_embeddings)
+    if match is None:
+        return None
+    print(f"[INFO] Intent fast path: {match[0]}")
+    return course_answer(IntentRouter.respond(*match))
 
 
-def course_related(user_query):
-    system_prompt = f"""
-    You are an assistant for the IIT Madras course 'Tools in Data Science' (May 2025), a 12-week, hands-on course focused on real-world data science workflows.
-
-    Course Metadata:
-    - Topics (`course_shrinked`): {course_shrinked}
-      (Each item is a webpage title; if a title mentions a concept/tool, the corresponding page covers it.)
-    - Related Technologies (`other_covered`): {other_covered}
-    - Assessments: 7 graded assignments (best 4 count for 15%), 2 projects (20% each), remote exam (20%), final exam (25%)
-    - Exams: Projects and remote exam are open-internet; final exam is in-person and closed-book
-    - Grading: Combination of automated and LLM evaluation
-    - Course Difficulty: High failure rate, time-intensive, unpredictable grading
-    - Culture: Collaborative, open-book (except final exam)
-
-    Rules:
-
-    1. **Topic Matching**:
-       - You must only select the topic from `course_shrinked`. Use an **exact string match** from the list.
-       - If the query directly matches or clearly relates (in concept or technology) to a `course_shrinked` title, return that exact title as `"topic"`.
-       - If multiple match, choose the most relevant. If none clearly match, pick the closest **verbatim** entry.
-       - **You must not invent, paraphrase, summarize, or synthesize new topic names**. The topic must be exactly from `course_shrinked`.
-
-    2. If the query is of the form “What is <topic>?” or similar, return:
-       {{ "answer": "You can find the details in the course materials or official course webpage.", "topic": "<matched_topic>" }}
-
-    3. If the query is about assessments, grading, or workload, answer based on the course metadata. Return both:
-       {{ "answer": "<metadata-based answer>", "topic": "Course Page" }}
-
-    4. If the query asks about dates or deadlines (assignments, exams, sessions, etc.), respond:
-       {{ "answer": "Sorry, I don't have access to specific dates or deadlines.", "topic": "Course Page" }}
-
-    5. If the query asks which tool, library, or technology to use in general:
-       - Say the course uses multiple technologies.
-       - Explicitly mention **every tool or technology referenced in the query**, even if only one is officially used in the course.
-       - Do not recommend one over another. Emphasize that all mentioned are important and needed for the course.
-       - Example: “This course uses a mix of tools and technologies. Since you mentioned R and Pandas, both are relevant and useful, and you are expected to learn both of them”
-
-    6. If the query is about **a specific assignment question** (e.g., "Which tool should I use for Question 3 in Assignment 4?"):
-       - Instruct the user to follow the question instructions exactly.
-       - Explicitly name the technology specified in the assignment question.
-       - Do not follow Rule 5 in this case.
-
-    7. If the query is about syllabus, grading policies, exams, portals, or other logistics, generate an appropriate "answer" from course metadata and set:
-       {{ "topic": "Course Page" }}
-
-    Output format:
-    - Return a **single valid JSON object**.
-    - The object must include:
-      - "answer": (your answer text)
-      - "topic": (one of the exact entries from `course_shrinked` OR "Course Page")
-    - Use only standard ASCII double quotes.
-    - Do not include any text, markdown, comments, explanations, or extra formatting outside the JSON.
-
-    STRICT CONSTRAINT:
-    - The "topic" must exactly match one of the strings in `course_shrinked` (unless it is "Course Page").
-    - If this rule is violated, your output is invalid.
-
-    """
-
-    system_prompt = system_prompt.lower()
-    user_query = user_query.lower()
-
-    url = "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
+async def discourse_stage(data, matches):
+    # Check discourse data for any similar question found.
+    if not matches:
+        return None
+    print("Using discourse context method...")
+    context = pack_contexts(matches, DISCOURSE_CONTEXT_TOKENS)
+    llm_response = await discourse_related(user_query=data, context=context)
+    print(llm_response)
+    return discourse_answer(llm_response, matches)
 
-    payload = {
-        "model": GPT_MODEL,
-        # "temperature": 0.5,
-        # "top_p": 1,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_query}
-        ]
+
+async def tds_stage(data, matches):
+    # Check course content for any similar page found.
+    if not matches:
+        return None
+    print("Using TDS content context method...")
+    context = pack_contexts(matches, COURSE_CONTEXT_TOKENS)
+    llm_response = await tds_content_related(user_query=data, context=context)
+    print(llm_response)
+    return tds_answer(llm_response, matches)
+
+
+async def course_stage(data, data_embeddings=None):
+    print("Using default method...")
+    course_response = await course_related(data, data_embeddings)
+    print(course_response)
+    return course_answer(course_response)
+
+
+async def run_cascade(data, discourse_matches, tds_matches, data_embeddings=None):
+    result = await discourse_stage(data, discourse_matches)
+    if result is not None:
+        record_answer("discourse")
+        return result
+    result = await tds_stage(data, tds_matches)
+    if result is not None:
+        record_answer("course_content")
+        return result
+    result = await course_stage(data, data_embeddings)
+    # Counted once the stage has answered: a failure here is only counted as an error
+    record_answer("course_metadata")
+    return result
+
+
+async def run_race(data, discourse_matches, tds_matches, data_embeddings=None):
+    # Start every stage at once, but still pick the answer in cascade priority order
+    tasks = {
+        "discourse": asyncio.create_task(discourse_stage(data, discourse_matches)),
+        "course_content": asyncio.create_task(tds_stage(data, tds_matches)),
+        "course_metadata": asyncio.create_task(course_stage(data, data_embeddings)),
     }
+    try:
+        for stage, task in tasks.items():
+            result = await task
+            if result is not None:
+                record_answer(stage)
+                return result
+    finally:
+        # Cancel lower-priority stages that are still waiting on the proxy
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
 
-    response = requests.post(url, headers=headers, json=payload)
 
-    if response.status_code == 200:
-        result = response.json()
-        reply_content = result["choices"][0]["message"]["content"]
+async def run_stages(data, discourse_matches, tds_matches, data_embeddings=None):
+    if ANSWER_MODE == "race":
+        return await run_race(data, discourse_matches, tds_matches, data_embeddings)
+    return await run_cascade(data, discourse_matches, tds_matches, data_embeddings)
 
-        # Extract JSON from markdown code block if present
-        json_match = re.search(r"```json\s*(.*?)\s*```", reply_content, re.DOTALL)
-        if json_match:
-            reply_content = json_match.group(1)
 
-        try:
-            parsed = json.loads(reply_content)
-            return parsed
-        except json.JSONDecodeError:
-            return {"answer": reply_content.strip(), "topic": "null"}
+def cache_answer(cache_key, result, data_embeddings):
+    # Don't keep answers built from an upstream error, or without the screenshot (cache_key None)
+    if cache_key is not None and result["links"] and result["links"][0]["url"] != "None":
+        answer_cache.put(cache_key, result, data_embeddings)
+
+
+def query_text(question, image_text):
+    # Merge question and image data.
+    return f"{question}\n{image_text}" if image_text else question
+
+
+def normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def merge_embeddings(question_embedding, image_embedding, image_weight=IMAGE_OCR_EMBEDDING_WEIGHT):
+    merged = (1 - image_weight) * normalize(question_embedding) + image_weight * normalize(image_embedding)
+    return normalize(merged).tolist()
+
+
+async def safe_ocr(image_data):
+    # A failed OCR leaves the question to be answered on its own text
+    try:
+        with span("ocr"):
+            return await get_ocr(image_data)
+    except Exception as e:
+        print(f"[WARN] OCR failed: {e}")
+        return None
+
+
+async def read_query(query):
+    # Returns (data, data_embeddings, cache_embeddings): the text the question is answered from, the
+    # embedding it is searched with (None after a decisive lexical match), and the embedding the answer is
+    # looked up and stored under in the semantic cache (None when that embedding doesn't cover the screenshot)
+    if query.image and IMAGE_QUERY_MODE == "serial":
+        print("image found...")
+        data = query_text(query.question, await safe_ocr(query.image))
+    elif query.image:
+        print("image found...")
+        return await read_image_query(query)
     else:
-        return {
-            "answer": f"Error {response.status_code}: {response.text}",
-            "topic": "null"
-        }
+        data = query.question
+    if await lexically_decisive(data):
+        print("[INFO] Decisive lexical match, skipping the question embedding")
+        return data, None, None
+    data_embeddings = await compute_embedding(data)
+    return data, data_embeddings, data_embeddings
+
+
+async def read_image_query(query):
+    # The OCR round trip runs alongside the embedding of the question's own text, instead of before it
+    ocr_task = asyncio.create_task(safe_ocr(query.image))
+    try:
+        if await lexically_decisive(query.question):
+            question_embedding = None
+        else:
+            question_embedding = await compute_embedding(query.question)
+    except BaseException:
+        ocr_task.cancel()
+        raise
+    image_text = await ocr_task
+    if not image_text:
+        return query.question, question_embedding, question_embedding
+
+    data = query_text(query.question, image_text)
+    if question_embedding is None:
+        # The question alone matched decisively; with the screenshot text added it may not
+        if await lexically_decisive(data):
+            return data, None, None
+        data_embeddings = await compute_embedding(data)
+        return data, data_embeddings, data_embeddings
+    if IMAGE_QUERY_MODE == "merge":
+        # One more embedding call for the screenshot text, folded into the question's vector
+        merged = merge_embeddings(question_embedding, await compute_embedding(image_text))
+        return data, merged, merged
+    # rerank: the vector side of the hybrid search uses the question's embedding, while the screenshot
+    # text only reaches retrieval through the BM25 side of the fused ranking (cheaper, but weaker)
+    return data, question_embedding, None
 
 
 @app.post("/api/")
 async def answer_query(query: QueryRequest):
     try:
-        image_data = ""
-        if query.image:
-            print("image found...")
-            image_data = get_ocr(query.image)
-
-        # Merge question and image data.
-        data = query.question + image_data
-        data_embeddings = compute_embedding(data)
-        # Check discourse data for any similar question found.
-        matches = find_similar_questions_later(data_embeddings)
-        if matches:
-            print("Using discourse context method...")
-            for i in range(len(matches)):
-                matches[i][0]['question'] = matches[i][0]['question'][:1500] + "....continued"
-            llm_response = discourse_related(user_query=data, context=matches)
-            print(llm_response)
-            answer_text = llm_response["answer"]
-            ques_num = llm_response["relevant"]
-            if ques_num != "error":
-                match, _ = matches[int(ques_num) - 1]
-
-                return {
-                    "answer": answer_text,
-                    "links": [
-                        {
-                            "url": match['url'],
-                            "text": match['answer']
-                        }
-                    ]
-                }
-
-        # Check discourse data for any similar question found.
-        matches = find_similar_questions_later_tds(data_embeddings)
-        if matches:
-            print("Using TDS content context method...")
-            llm_response = tds_content_related(user_query=data, context=matches)
-            print(llm_response)
-            answer_text = llm_response["answer"]
-            ques_num = llm_response["relevant"]
-            if ques_num != "error":
-                match, _ = matches[int(ques_num) - 1]
-
-                return {
-                    "answer": answer_text,
-                    "links": [
-                        {
-                            "url": match['url'],
-                            "text": match['question']
-                        }
-                    ]
-                }
-        print("Using default method...")
-        course_response = course_related(data)
-        print(course_response)
-        answer = course_response["answer"]
-        topic = course_response["topic"]
-        if topic in course_content:
-            url = course_content[topic]
-        else:
-            url = "None"
-        return {
-            "answer": answer,
-            "links": [
-                {
-                    "url": url,
-                    "text": topic
-                }
-            ]
-        }
+        cache_key = make_cache_key(query.question, query.image)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            print("[INFO] Answer cache hit (exact)")
+            record_answer("cache_exact")
+            return cached
+        fast = fast_path_answer(query)
+        if fast is not None:
+            record_answer("fast_path")
+            return fast
+
+        data, data_embeddings, cache_embeddings = await read_query(query)
+        if query.image and data == query.question:
+            # The screenshot couldn't be read: answer from the question alone, but don't keep that answer
+            cache_key = None
+        if cache_embeddings is not None:
+            cached = answer_cache.get_similar(cache_embeddings)
+            if cached is not None:
+                print("[INFO] Answer cache hit (similar question)")
+                record_answer("cache_semantic")
+                return cached
+            fast = fast_path_answer(query, cache_embeddings)
+            if fast is not None:
+                record_answer("fast_path")
+                return fast
+
+        result = await run_stages(data, *await retrieve(data, data_embeddings), data_embeddings)
+        cache_answer(cache_key, result, cache_embeddings)
+        return result
     except Exception as e:
         print(f"Error: {e}")
+        record_answer("error")
         return {"answer": "An error occurred...", "links": []}
 
 
+async def stream_llm_reply(stage, payload, fallback):
+    # Yields ("token", text) for answer text as it is generated, then ("reply", parsed JSON reply).
+    # The stage's span also covers the time the client takes to read the tokens.
+    extractor = JSONAnswerStream()
+    reply = []
+    try:
+        with span(f"llm_{stage}"):
+            async for delta in llm_client.stream_chat_completion(payload):
+                reply.append(delta)
+                text = extractor.feed(delta)
+                if text:
+                    yield "token", text
+    except httpx.HTTPStatusError as e:
+        yield "reply", {"answer": f"API error {e.response.status_code}: {e.response.text}", **fallback}
+        return
+    yield "reply", parse_llm_reply("".join(reply), fallback)
+
+
+async def stream_answer(query):
+    try:
+        cache_key = make_cache_key(query.question, query.image)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            record_answer("cache_exact")
+            yield sse_event("result", cached)
+            return
+        fast = fast_path_answer(query)
+        if fast is not None:
+            record_answer("fast_path")
+            yield sse_event("result", fast)
+            return
+
+        data, data_embeddings, cache_embeddings = await read_query(query)
+        if query.image and data == query.question:
+            # The screenshot couldn't be read: answer from the question alone, but don't keep that answer
+            cache_key = None
+        if cache_embeddings is not None:
+            cached = answer_cache.get_similar(cache_embeddings)
+            if cached is not None:
+                record_answer("cache_semantic")
+                yield sse_event("result", cached)
+                return
+            fast = fast_path_answer(query, cache_embeddings)
+            if fast is not None:
+                record_answer("fast_path")
+                yield sse_event("result", fast)
+                return
+
+        discourse_matches, tds_matches = await retrieve(data, data_embeddings)
+        stages = [
+            ("discourse", discourse_matches, DISCOURSE_CONTEXT_TOKENS, discourse_payload, discourse_answer, "answer"),
+            ("course_content", tds_matches, COURSE_CONTEXT_TOKENS, tds_content_payload, tds_answer, "question"),
+        ]
+        for stage, matches, max_tokens, build_payload, build_answer, link_field in stages:
+            if not matches:
+                continue
+            print(f"Streaming {stage} context method...")
+            yield sse_event("sources", {
+                "stage": stage,
+                "links": [{"url": match["url"], "text": match[link_field]} for match, _ in matches]
+            })
+            streamed = False
+            context = pack_contexts(matches, max_tokens)
+            async for kind, value in stream_llm_reply(stage, build_payload(data, context), {"relevant": "error"}):
+                if kind == "token":
+                    streamed = True
+                    yield sse_event("token", {"text": value})
+                else:
+                    result = build_answer(value, matches)
+            if result is not None:
+                record_answer(stage)
+                cache_answer(cache_key, result, cache_embeddings)
+                yield sse_event("result", result)
+                return
+            # The model wrote an answer but then rejected every context: tell the client to discard it
+            if streamed:
+                yield sse_event("reset", {"stage": stage})
+
+        print("Streaming default method...")
+        yield sse_event("sources", {"stage": "course_metadata", "links": []})
+        async for kind, value in stream_llm_reply("course_metadata", course_payload(data, data_embeddings), {"topic": "null"}):
+            if kind == "token":
+                yield sse_event("token", {"text": value})
+            else:
+                result = course_answer(value)
+        record_answer("course_metadata")
+        cache_answer(cache_key, result, cache_embeddings)
+        yield sse_event("result", result)
+    except Exception as e:
+        print(f"Error: {e}")
+        record_answer("error")
+        yield sse_event("result", {"answer": "An error occurred...", "links": []})
+
+
+@app.post("/api/stream")
+async def answer_query_stream(query: QueryRequest):
+    return StreamingResponse(
+        stream_answer(query),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def answer_batch_as_completed(queries):
+    error_result = {"answer": "An error occurred...", "links": []}
+    cache_keys = [make_cache_key(q.question, q.image) for q in queries]
+    pending = []
+    for i, key in enumerate(cache_keys):
+        cached = answer_cache.get(key)
+        if cached is not None:
+            record_answer("cache_exact")
+            yield i, cached
+            continue
+        fast = fast_path_answer(queries[i])
+        if fast is not None:
+            record_answer("fast_path")
+            yield i, fast
+        else:
+            pending.append(i)
+    if not pending:
+        return
+
+    try:
+        data = [queries[i].question for i in pending]
+        data_embeddings, cache_embeddings = [None] * len(pending), [None] * len(pending)
+        discourse_matches, tds_matches = [None] * len(pending), [None] * len(pending)
+        with_image = [j for j, i in enumerate(pending) if queries[i].image]
+        # Questions with a decisive lexical match are retrieved without an embedding
+        to_embed = []
+        for j, text in enumerate(data):
+            if queries[pending[j]].image:
+                continue
+            if await lexically_decisive(text):
+                discourse_matches[j], tds_matches[j] = await retrieve(text, None)
+            else:
+                to_embed.append(j)
+
+        async def embed_texts():
+            # The text-only questions share one embedding call
+            if not to_embed:
+                return
+            texts = [data[j] for j in to_embed]
+            embedded = await compute_embeddings(texts)
+            discourse_hits, tds_hits = await retrieve_many(texts, embedded)
+            for k, j in enumerate(to_embed):
+                data_embeddings[j] = cache_embeddings[j] = embedded[k]
+                discourse_matches[j], tds_matches[j] = discourse_hits[k], tds_hits[k]
+
+        async def read_image(j):
+            # Screenshots are read the way /api/ reads them, following IMAGE_QUERY_MODE
+            query = queries[pending[j]]
+            data[j], data_embeddings[j], cache_embeddings[j] = await read_query(query)
+            if data[j] == query.question:
+                # The screenshot couldn't be read: don't keep that answer under the screenshot's key
+                cache_keys[pending[j]] = None
+            discourse_matches[j], tds_matches[j] = await retrieve(data[j], data_embeddings[j])
+
+        await asyncio.gather(embed_texts(), *(read_image(j) for j in with_image))
+    except Exception as e:
+        print(f"Error: {e}")
+        for i in pending:
+            record_answer("error")
+            yield i, error_result
+        return
+
+    # Bound how many questions of one batch hold LLM stages open at once
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer_one(j):
+        i = pending[j]
+        try:
+            if cache_embeddings[j] is not None:
+                cached = answer_cache.get_similar(cache_embeddings[j])
+                if cached is not None:
+                    record_answer("cache_semantic")
+                    return i, cached
+                fast = fast_path_answer(queries[i], cache_embeddings[j])
+                if fast is not None:
+                    record_answer("fast_path")
+                    return i, fast
+            async with semaphore:
+                result = await run_stages(data[j], discourse_matches[j], tds_matches[j], data_embeddings[j])
+            cache_answer(cache_keys[i], result, cache_embeddings[j])
+            return i, result
+        except Exception as e:
+            print(f"Error: {e}")
+            record_answer("error")
+            return i, error_result
+
+    for next_done in asyncio.as_completed([answer_one(j) for j in range(len(pending))]):
+        yield await next_done
+
+
+@app.post("/api/batch")
+async def answer_batch(batch: BatchQueryRequest):
+    if len(batch.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    if batch.stream:
+        # One JSON line per question, in completion order, tagged with its position in the request
+        async def ndjson_lines():
+            async for i, result in answer_batch_as_completed(batch.questions):
+                yield json.dumps({"index": i, **result}) + "\n"
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    results = [None] * len(batch.questions)
+    async for i, result in answer_batch_as_completed(batch.questions):
+        results[i] = result
+    return {"results": results}
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,193 @@
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from config import METRICS_LATENCY_BUCKETS
+
+PREFIX = "tds_ta"
+
+_current = contextvars.ContextVar("request_trace", default=None)
+_lock = threading.Lock()
+
+
+# -------------------- Histograms / Counters --------------------
+class Histogram:
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            yield f"{name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum:.6f}"
+        yield f"{name}_count{format_labels(labels)} {self.count}"
+
+
+# span -> Histogram, (endpoint, status) -> Histogram, and counters keyed by their label values
+stage_seconds = defaultdict(Histogram)
+request_seconds = defaultdict(Histogram)
+answers_total = defaultdict(int)
+upstream_errors_total = defaultdict(int)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+# -------------------- Per-request Traces --------------------
+class RequestTrace:
+    def __init__(self, request_id, endpoint):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = defaultdict(float)
+        self.answers = defaultdict(int)
+        self.status = None
+
+
+@contextmanager
+def span(name):
+    # Times a block into the `name` stage histogram and the current request's log line.
+    # Stages running concurrently (race mode, batch) add up in the log line.
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            stage_seconds[name].observe(elapsed)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans[name] += elapsed
+
+
+def record_answer(stage):
+    # stage: which stage produced the answer (cache_exact, fast_path, discourse, ...)
+    with _lock:
+        answers_total[stage] += 1
+    trace = _current.get()
+    if trace is not None:
+        trace.answers[stage] += 1
+
+
+def record_upstream_error(path, status):
+    with _lock:
+        upstream_errors_total[(path, status)] += 1
+
+
+def finish_request(trace):
+    elapsed = time.perf_counter() - trace.started
+    with _lock:
+        request_seconds[(trace.endpoint, trace.status)].observe(elapsed)
+    answers = ",".join(f"{stage}:{n}" if n > 1 else stage for stage, n in trace.answers.items()) or "none"
+    spans = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in trace.spans.items())
+    print(
+        f"[INFO] request={trace.request_id} endpoint={trace.endpoint} status={trace.status} "
+        f"answer={answers} total={elapsed * 1000:.1f}ms {spans}".rstrip()
+    )
+
+
+class RequestMetricsMiddleware:
+    # Plain ASGI middleware, so a streamed response is only timed once its last chunk is sent
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:12]
+        trace = RequestTrace(request_id, scope["path"])
+        token = _current.set(trace)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = list(message.get("headers") or []) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except Exception:
+            trace.status = 500
+            raise
+        finally:
+            _current.reset(token)
+            finish_request(trace)
+
+
+# -------------------- Prometheus Text Format --------------------
+def render_metrics(cache_stats=()):
+    # cache_stats: (cache, namespace, hits, misses) for each cache to report
+    lines = []
+    with _lock:
+        lines += [
+            f"# HELP {PREFIX}_request_seconds Time to answer a request, by endpoint and status.",
+            f"# TYPE {PREFIX}_request_seconds histogram",
+        ]
+        for (endpoint, status), histogram in sorted(request_seconds.items(), key=lambda item: str(item[0])):
+            lines += histogram.lines(f"{PREFIX}_request_seconds", {"endpoint": endpoint, "status": status})
+
+        lines += [
+            f"# HELP {PREFIX}_stage_seconds Time spent in each stage of answering a question.",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        for name, histogram in sorted(stage_seconds.items()):
+            lines += histogram.lines(f"{PREFIX}_stage_seconds", {"stage": name})
+
+        lines += [
+            f"# HELP {PREFIX}_answers_total Answers by the stage that produced them.",
+            f"# TYPE {PREFIX}_answers_total counter",
+        ]
+        lines += [f"{PREFIX}_answers_total{format_labels({'stage': stage})} {n}" for stage, n in sorted(answers_total.items())]
+        total = sum(answers_total.values())
+        lines += [
+            f"# HELP {PREFIX}_answer_stage_ratio Share of answers produced by each stage.",
+            f"# TYPE {PREFIX}_answer_stage_ratio gauge",
+        ]
+        lines += [
+            f"{PREFIX}_answer_stage_ratio{format_labels({'stage': stage})} {n / total:.6f}"
+            for stage, n in sorted(answers_total.items())
+        ]
+
+        lines += [
+            f"# HELP {PREFIX}_upstream_errors_total Failed calls to the OpenAI-compatible proxy, by path and status.",
+            f"# TYPE {PREFIX}_upstream_errors_total counter",
+        ]
+        lines += [
+            f"{PREFIX}_upstream_errors_total{format_labels({'path': path, 'status': status})} {n}"
+            for (path, status), n in sorted(upstream_errors_total.items(), key=lambda item: str(item[0]))
+        ]
+
+    lines += [
+        f"# HELP {PREFIX}_cache_lookups_total Cache lookups by cache, namespace and result.",
+        f"# TYPE {PREFIX}_cache_lookups_total counter",
+    ]
+    ratios = []
+    for cache, namespace, hits, misses in cache_stats:
+        labels = {"cache": cache, "namespace": namespace}
+        lines.append(f"{PREFIX}_cache_lookups_total{format_labels({**labels, 'result': 'hit'})} {hits}")
+        lines.append(f"{PREFIX}_cache_lookups_total{format_labels({**labels, 'result': 'miss'})} {misses}")
+        if hits + misses:
+            ratios.append(f"{PREFIX}_cache_hit_ratio{format_labels(labels)} {hits / (hits + misses):.6f}")
+    lines += [
+        f"# HELP {PREFIX}_cache_hit_ratio Share of cache lookups that hit.",
+        f"# TYPE {PREFIX}_cache_hit_ratio gauge",
+    ] + ratios
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,207 @@
+import json
+import numpy as np
+from course_content.content_filtered import course_shrinked, other_covered
+from lexical_index import tokenize
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# -------------------- Token Counting --------------------
+_encoding = None
+
+
+def load_token_encoding():
+    # Called once at startup: the first load may download the encoding file, which must not
+    # happen on the event loop in the middle of a request
+    global _encoding
+    if tiktoken is None:
+        print("[INFO] tiktoken not installed, estimating prompt sizes")
+        return
+    try:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encoding file couldn't be loaded (e.g. offline): keep estimating
+        print(f"[WARN] Could not load the o200k_base encoding, estimating prompt sizes: {e}")
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages):
+    # Each chat message carries a few tokens of framing on top of its content
+    return sum(count_tokens(m["content"]) + 4 for m in messages) + 2
+
+
+# -------------------- Static Prefixes --------------------
+# Built once at import and kept byte-identical across calls, with everything per-request at the end,
+# so the upstream prompt cache can reuse the prefix.
+DISCOURSE_PREFIX = """You are a professor for the IIT Madras course 'Tools in Data Science'. A student has asked a question.
+Below are numbered similar questions along with their corresponding answers from past interactions.
+
+Your task:
+1. Carefully read the student's question and the provided similar questions and answers.
+2. If any of the similar Q&A pairs are helpful, use them to write a clear, accurate, and helpful answer to the student's question. Use same analogies or metaphors given in the answers.
+3. Indicate which of the similar questions was most helpful in forming your answer.
+4. If none of the provided Q&A pairs are relevant or helpful, respond with:
+   { "answer": "error", "relevant": "error" }
+
+Respond strictly in the following JSON format:
+{
+  "answer": "...",
+  "relevant": n  # the number of the most helpful question, or "error" if none were useful
+}
+"""
+
+TDS_PREFIX = """You are a professor for the IIT Madras course 'Tools in Data Science'. A student has asked a question.
+Below are numbered context passages from course materials.
+
+Your task:
+1. Read the question and the context carefully.
+2. If any context is relevant, use it to generate a clear, accurate, and helpful answer.
+3. Specify which context was most helpful.
+4. If none are relevant, return:
+   { "answer": "error", "relevant": "error" }
+
+Respond *only* in this exact JSON format:
+{
+  "answer": "...",
+  "relevant": n  # the number of the most helpful context, or "error"
+}
+"""
+
+COURSE_PREFIX = """You are an assistant for the IIT Madras course 'Tools in Data Science' (May 2025), a 12-week, hands-on course focused on real-world data science workflows.
+
+Course Metadata:
+- Assessments: 7 graded assignments (best 4 count for 15%), 2 projects (20% each), remote exam (20%), final exam (25%)
+- Exams: Projects and remote exam are open-internet; final exam is in-person and closed-book
+- Grading: Combination of automated and LLM evaluation
+- Course Difficulty: High failure rate, time-intensive, unpredictable grading
+- Culture: Collaborative, open-book (except final exam)
+- Topics (`course_shrinked`) and related technologies (`other_covered`) are listed at the end.
+  (Each topic is a webpage title; if a title mentions a concept/tool, the corresponding page covers it.)
+
+Rules:
+
+1. **Topic Matching**:
+   - You must only select the topic from `course_shrinked`. Use an **exact string match** from the list.
+   - If the query directly matches or clearly relates (in concept or technology) to a `course_shrinked` title, return that exact title as `"topic"`.
+   - If multiple match, choose the most relevant. If none clearly match, pick the closest **verbatim** entry.
+   - **You must not invent, paraphrase, summarize, or synthesize new topic names**. The topic must be exactly from `course_shrinked`.
+
+2. If the query is of the form "What is <topic>?" or similar, return:
+   { "answer": "You can find the details in the course materials or official course webpage.", "topic": "<matched_topic>" }
+
+3. If the query is about assessments, grading, or workload, answer based on the course metadata. Return both:
+   { "answer": "<metadata-based answer>", "topic": "Course Page" }
+
+4. If the query asks about dates or deadlines (assignments, exams, sessions, etc.), respond:
+   { "answer": "Sorry, I don't have access to specific dates or deadlines.", "topic": "Course Page" }
+
+5. If the query asks which tool, library, or technology to use in general:
+   - Say the course uses multiple technologies.
+   - Explicitly mention **every tool or technology referenced in the query**, even if only one is officially used in the course.
+   - Do not recommend one over another. Emphasize that all mentioned are important and needed for the course.
+   - Example: "This course uses a mix of tools and technologies. Since you mentioned R and Pandas, both are relevant and useful, and you are expected to learn both of them"
+
+6. If the query is about **a specific assignment question** (e.g., "Which tool should I use for Question 3 in Assignment 4?"):
+   - Instruct the user to follow the question instructions exactly.
+   - Explicitly name the technology specified in the assignment question.
+   - Do not follow Rule 5 in this case.
+
+7. If the query is about syllabus, grading policies, exams, portals, or other logistics, generate an appropriate "answer" from course metadata and set:
+   { "topic": "Course Page" }
+
+Output format:
+- Return a **single valid JSON object**.
+- The object must include:
+  - "answer": (your answer text)
+  - "topic": (one of the exact entries from `course_shrinked` OR "Course Page")
+- Use only standard ASCII double quotes.
+- Do not include any text, markdown, comments, explanations, or extra formatting outside the JSON.
+
+STRICT CONSTRAINT:
+- The "topic" must exactly match one of the strings in `course_shrinked` (unless it is "Course Page").
+- If this rule is violated, your output is invalid.
+"""
+
+
+# -------------------- Context Blocks --------------------
+def choice_list(matches):
+    numbers = [str(n) for n in range(1, len(matches) + 1)]
+    return numbers[0] if len(numbers) == 1 else ", ".join(numbers[:-1]) + " or " + numbers[-1]
+
+
+def format_context(matches):
+    # Number the candidates the way the model is asked to refer to them
+    return "\n".join(
+        f"{n}. " + json.dumps({"question": match["question"], "answer": match["answer"]}, ensure_ascii=False)
+        for n, (match, _) in enumerate(matches, 1)
+    )
+
+
+def context_messages(prefix, user_query, context):
+    system_prompt = f"{prefix}\n\"relevant\" must be one of {choice_list(context)}.\n\ncontext =\n{format_context(context)}\n"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_query}
+    ]
+
+
+def discourse_messages(user_query, context):
+    return context_messages(DISCOURSE_PREFIX, user_query, context)
+
+
+def tds_content_messages(user_query, context):
+    return context_messages(TDS_PREFIX, user_query, context)
+
+
+# -------------------- Course Topic Selection --------------------
+class TopicSelector:
+    # Narrows `course_shrinked` down to the topics closest to the question
+    def __init__(self, topics=course_shrinked, top_n=8):
+        self.topics = list(topics)
+        self.top_n = top_n
+        self.topic_tokens = [set(tokenize(t)) for t in self.topics]
+        self.matrix = None
+
+    def fit(self, topic_embeddings):
+        matrix = np.asarray(topic_embeddings, dtype=np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def select(self, question, embedding=None):
+        if not self.top_n:
+            return self.topics
+        if self.matrix is not None and embedding is not None:
+            query = np.asarray(embedding, dtype=np.float32)
+            scores = self.matrix @ (query / np.linalg.norm(query))
+            order = np.argsort(-scores, kind="stable")[:self.top_n]
+        else:
+            # No vectors to compare: rank by shared terms, or keep every topic if none are shared
+            words = set(tokenize(question))
+            overlaps = np.array([len(words & tokens) for tokens in self.topic_tokens])
+            if not overlaps.any():
+                return self.topics
+            order = [i for i in np.argsort(-overlaps, kind="stable")[:self.top_n] if overlaps[i] > 0]
+        return [self.topics[i] for i in order]
+
+
+def mentioned_technologies(question, technologies=other_covered):
+    words = set(tokenize(question))
+    return [t for t in technologies if set(tokenize(t)) & words]
+
+
+def course_messages(user_query, topics):
+    suffix = f"\nTopics (`course_shrinked`): {json.dumps(topics)}\n"
+    related = mentioned_technologies(user_query)
+    if related:
+        suffix += f"Related technologies mentioned in the query (`other_covered`): {json.dumps(related)}\n"
+    return [
+        {"role": "system", "content": COURSE_PREFIX + suffix},
+        {"role": "user", "content": user_query}
+    ]
@@ -0,0 +1,248 @@
+import json
+import hashlib
+import numpy as np
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+# -------------------- Vectorized Similarity --------------------
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_similar(normalized_matrix, user_embedding, top_n=1, threshold=0.5):
+    query = np.asarray(user_embedding, dtype=np.float32)
+    query = query / np.linalg.norm(query)
+    similarities = (normalized_matrix @ query).astype(np.float32)
+
+    k = min(top_n, len(similarities))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    # Only the k best rows are ever sorted; the rest of the corpus is partitioned away in O(n)
+    if k < len(similarities):
+        candidates = np.argpartition(-similarities, k - 1)[:k]
+    else:
+        candidates = np.arange(len(similarities))
+    candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+    scores = similarities[candidates]
+    keep = scores >= threshold
+    return candidates[keep], scores[keep]
+
+
+def top_k_similar_many(normalized_matrix, user_embeddings, top_n=1, threshold=0.5):
+    queries = normalize_rows(user_embeddings)
+    # One matrix-matrix product scores every query against the whole corpus
+    similarities = (queries @ normalized_matrix.T).astype(np.float32)
+
+    k = min(top_n, similarities.shape[1])
+    if k <= 0:
+        return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+    if k < similarities.shape[1]:
+        candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(similarities.shape[1]), (len(queries), 1))
+    scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+
+    results = []
+    for row_candidates, row_scores in zip(candidates, scores):
+        keep = row_scores >= threshold
+        results.append((row_candidates[keep], row_scores[keep]))
+    return results
+
+
+def find_similar_questions(user_embedding, qa_data, stored_embeddings, top_n=1, threshold=0.5):
+    indices, scores = top_k_similar(normalize_rows(stored_embeddings), user_embedding, top_n, threshold)
+    return [(qa_data[i], float(score)) for i, score in zip(indices, scores)]
+
+
+# -------------------- Index Backends --------------------
+class BruteForceBackend:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def search(self, user_embedding, top_n, threshold):
+        return top_k_similar(self.matrix, user_embedding, top_n, threshold)
+
+    def search_many(self, user_embeddings, top_n, threshold):
+        return top_k_similar_many(self.matrix, user_embeddings, top_n, threshold)
+
+
+class IVFBackend:
+    # Inverted-file index: rows are bucketed under k-means centroids and a query only
+    # scores the rows in its `nprobe` closest buckets.
+    def __init__(self, matrix, nlist=None, nprobe=8, iterations=10, train_size=50000, seed=0):
+        rng = np.random.default_rng(seed)
+        n = len(matrix)
+        self.matrix = matrix
+        self.nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+
+        sample_ids = np.sort(rng.choice(n, min(n, train_size), replace=False))
+        sample = np.asarray(matrix[sample_ids], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=self.nlist)
+            # Keep the previous centroid for any bucket that ended up empty
+            sums[counts == 0] = centroids[counts == 0]
+            centroids = normalize_rows(sums)
+        self.centroids = centroids
+
+        assign = np.concatenate([
+            np.argmax(np.asarray(matrix[start:start + 65536], dtype=np.float32) @ centroids.T, axis=1)
+            for start in range(0, n, 65536)
+        ])
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def search(self, user_embedding, top_n, threshold):
+        query = np.asarray(user_embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, self.nprobe - 1)[:self.nprobe]
+        candidates = np.sort(np.concatenate([self.lists[c] for c in probe]))
+        local, scores = top_k_similar(self.matrix[candidates], query, top_n, threshold)
+        return candidates[local], scores
+
+
+class HNSWBackend:
+    def __init__(self, matrix, m=16, ef_construction=200, ef_search=64, seed=0):
+        if hnswlib is None:
+            raise ImportError("The hnsw index backend needs `pip install hnswlib`")
+        n, dim = matrix.shape
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=max(n, 1), M=m, ef_construction=ef_construction, random_seed=seed)
+        self.index.add_items(np.asarray(matrix, dtype=np.float32), np.arange(n))
+        self.index.set_ef(ef_search)
+
+    def search(self, user_embedding, top_n, threshold):
+        k = min(top_n, self.index.get_current_count())
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.asarray(user_embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(query, k=k)
+        # hnswlib's inner-product distance is 1 - dot product
+        scores = (1.0 - distances[0]).astype(np.float32)
+        keep = scores >= threshold
+        return labels[0][keep].astype(np.int64), scores[keep]
+
+
+INDEX_BACKENDS = {
+    "brute": BruteForceBackend,
+    "ivf": IVFBackend,
+    "hnsw": HNSWBackend,
+}
+
+
+def build_backend(name, matrix, **params):
+    if name not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend {name!r}, expected one of {sorted(INDEX_BACKENDS)}")
+    if name == "hnsw" and hnswlib is None:
+        print("[WARN] hnswlib is not installed, falling back to the brute force index")
+        return BruteForceBackend(matrix)
+    return INDEX_BACKENDS[name](matrix, **params)
+
+
+# -------------------- Resident Retrieval Index --------------------
+# Candidates fetched per requested match when near-duplicates are being filtered out
+DEDUPE_OVERFETCH = 3
+
+class RetrievalIndex:
+    def __init__(self, records, embeddings, normalized=False, backend="brute", lexical_fields=None, rrf_k=60,
+                 lexical_min_coverage=0.5, store_version=None, **backend_params):
+        self.records = records
+        if normalized:
+            # Already unit-length rows (e.g. a memory-mapped embedding store): use them in place
+            self.matrix = embeddings
+        else:
+            self.matrix = normalize_rows(embeddings)
+            self.matrix.setflags(write=False)
+        # Fingerprint of the corpus, so caches built on top of it know when it was rebuilt. A memory-mapped
+        # store is identified by its manifest (store_version), so its matrix is never copied just to hash it.
+        digest = hashlib.sha256(json.dumps(records, sort_keys=True).encode("utf-8"))
+        if store_version is not None:
+            digest.update(store_version.encode("utf-8"))
+        else:
+            digest.update(np.ascontiguousarray(self.matrix).tobytes())
+        self.version = digest.hexdigest()[:16]
+        self.backend = build_backend(backend, self.matrix, **backend_params)
+        # Optional BM25 index over the given record fields, fused with the vector ranking
+        self.lexical = None
+        self.rrf_k = rrf_k
+        # A BM25 hit only joins the fused ranking if it covers this much of the question's terms
+        self.lexical_min_coverage = lexical_min_coverage
+        if lexical_fields:
+            self.lexical = BM25Index([" ".join(r.get(f, "") for f in lexical_fields) for r in records])
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, user_embedding, top_n=1, threshold=0.5, dedupe_similarity=None, query_text=None):
+        # With query_text the vector and BM25 rankings are fused; with no embedding, BM25 alone is used
+        fetch = top_n if dedupe_similarity is None else top_n * DEDUPE_OVERFETCH
+        if user_embedding is None:
+            indices, scores = self._lexical_search(query_text, fetch)
+        else:
+            indices, scores = self.backend.search(user_embedding, fetch, threshold)
+            indices, scores = self._fuse(indices, scores, query_text, fetch)
+        return self._to_matches(*self._dedupe(indices, scores, top_n, dedupe_similarity))
+
+    def search_many(self, user_embeddings, top_n=1, threshold=0.5, dedupe_similarity=None, query_texts=None):
+        fetch = top_n if dedupe_similarity is None else top_n * DEDUPE_OVERFETCH
+        if hasattr(self.backend, "search_many"):
+            hits = self.backend.search_many(user_embeddings, fetch, threshold)
+        else:
+            hits = [self.backend.search(e, fetch, threshold) for e in user_embeddings]
+        if query_texts is not None:
+            hits = [self._fuse(indices, scores, text, fetch) for (indices, scores), text in zip(hits, query_texts)]
+        return [self._to_matches(*self._dedupe(indices, scores, top_n, dedupe_similarity)) for indices, scores in hits]
+
+    def _lexical_search(self, query_text, top_n):
+        if self.lexical is None or not query_text:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.lexical.search(query_text, top_n, self.lexical_min_coverage)
+
+    def _fuse(self, indices, scores, query_text, top_n):
+        lexical_indices, _ = self._lexical_search(query_text, top_n)
+        if len(lexical_indices) == 0:
+            return indices, scores
+        fused_indices, fused_scores = reciprocal_rank_fusion([indices, lexical_indices], self.rrf_k)
+        return fused_indices[:top_n], fused_scores[:top_n]
+
+    def decisive_lexical_match(self, query_text, min_coverage=0.8, min_margin=1.5):
+        if self.lexical is None:
+            return None
+        return self.lexical.decisive_match(query_text, min_coverage, min_margin)
+
+    def _dedupe(self, indices, scores, top_n, dedupe_similarity):
+        if dedupe_similarity is None or len(indices) <= 1:
+            return indices[:top_n], scores[:top_n]
+        # Greedily keep the best candidates that aren't near-copies of one already kept
+        rows = np.asarray(self.matrix[indices], dtype=np.float32)
+        kept = []
+        for i in range(len(indices)):
+            if all(float(rows[i] @ rows[j]) < dedupe_similarity for j in kept):
+                kept.append(i)
+                if len(kept) == top_n:
+                    break
+        return indices[kept], scores[kept]
+
+    def _to_matches(self, indices, scores):
+        # Hand out copies so request handlers can't mutate the resident records
+        return [(dict(self.records[i]), float(score)) for i, score in zip(indices, scores)]
@@ -0,0 +1,49 @@
+import numpy as np
+import answer_cache
+from answer_cache import AnswerCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def cache_with_clock(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache, "time", clock)
+    return AnswerCache(**kwargs), clock
+
+
+def test_expired_best_match_falls_back_to_valid_near_duplicate(monkeypatch):
+    cache, clock = cache_with_clock(monkeypatch, ttl=60, similarity_threshold=0.9)
+    cache.put("old", {"answer": "old"}, [1.0, 0.0, 0.0])
+    clock.now += 50
+    cache.put("fresh", {"answer": "fresh"}, [1.0, 0.2, 0.0])
+    clock.now += 20
+
+    assert cache.get_similar([1.0, 0.01, 0.0]) == {"answer": "fresh"}
+    assert "old" not in cache.entries
+    assert cache.hits["semantic"] == 1
+
+
+def test_expired_slots_are_freed_for_reuse(monkeypatch):
+    cache, clock = cache_with_clock(monkeypatch, max_size=2, ttl=60)
+    cache.put("a", {"answer": "a"}, [1.0, 0.0])
+    cache.put("b", {"answer": "b"}, [0.0, 1.0])
+    clock.now += 61
+
+    assert cache.get_similar([1.0, 0.0]) is None
+    assert len(cache) == 0
+    assert len(cache.free_slots) == 2
+    assert np.isnan(cache.slot_stored_at).all()
+
+
+def test_below_threshold_is_a_miss(monkeypatch):
+    cache, _ = cache_with_clock(monkeypatch, similarity_threshold=0.95)
+    cache.put("a", {"answer": "a"}, [1.0, 0.0])
+
+    assert cache.get_similar([1.0, 1.0]) is None
+    assert cache.misses["semantic"] == 1
@@ -0,0 +1,34 @@
+import json
+import pytest
+from answer_stream import JSONAnswerStream
+
+REPLIES = [
+    '{"answer": "Use \\"uv run\\" instead.\\nThen retry \\ud83d\\ude00 caf\\u00e9", "relevant": 1}',
+    '{"relevant": 2, "answer": "Done \\ud83d\\udc4d\\ud83c\\udf89!"}',
+    '{"answer": "Plain text with a tab\\tand a slash \\/ end"}',
+]
+
+
+def stream(reply, size):
+    extractor = JSONAnswerStream()
+    return "".join(extractor.feed(reply[i:i + size]) for i in range(0, len(reply), size))
+
+
+@pytest.mark.parametrize("reply", REPLIES)
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 1000])
+def test_split_chunks_decode_like_json(reply, size):
+    text = stream(reply, size)
+    assert text == json.loads(reply)["answer"]
+    text.encode("utf-8")
+
+
+def test_lone_surrogates_are_replaced():
+    text = stream('{"answer": "a \\ud83d b \\ude00 c"}', 1)
+    assert text == "a � b � c"
+    text.encode("utf-8")
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_error_sentinel_is_held_back(size):
+    assert stream('{"answer": "error", "relevant": "error"}', size) == ""
+    assert stream('{"answer": "errors happen", "relevant": 1}', size) == "errors happen"
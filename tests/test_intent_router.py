@@ -0,0 +1,44 @@
+import pytest
+from intent_router import IntentRouter
+
+router = IntentRouter()
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("When is the assignment due?", "deadline"),
+    ("What is the last date to submit the project?", "deadline"),
+    ("Has the deadline been extended?", "deadline"),
+    ("What is the deadline for GA3?", "deadline"),
+    ("Can I get an extension of the deadline for GA3?", "deadline"),
+    ("When will the end term exam be held?", "deadline"),
+    ("When is the remote exam?", "deadline"),
+    ("Till when can I submit GA3?", "deadline"),
+    ("How is the final grade calculated?", "grading"),
+    ("How will the projects be evaluated?", "grading"),
+    ("What is the weightage of the projects and exams?", "grading"),
+    ("Are the best 4 assignments counted?", "grading"),
+    ("Is the final exam open book?", "exam_format"),
+    ("How hard is this course?", "workload"),
+    ("Where do I submit my assignments?", "portal"),
+])
+def test_logistics_questions_match(question, intent):
+    assert router.match_rules(question)[0] == intent
+
+
+@pytest.mark.parametrize("question", [
+    "Which VS Code extension should I install for Python?",
+    "When do I use uv run instead of python in the project?",
+    "Chrome extension for scraping in project 1 not working",
+    "how is the embedding calculated in the project?",
+    "How is the cosine similarity calculated?",
+    "What is docker?",
+    "How hard is it to deploy a FastAPI app on Vercel?",
+    "When does the server start listening in the project?",
+    "Which date format should I use with pandas?",
+    "sir i didn't get any mail regarding evaluation of project 2 yet, though i submitted it before the deadline",
+    "i also edited my form due to /api/ after deadline on monday can u tell atleast whats the status on this query",
+    "how do I calculate final score in pandas",
+    "What is the weightage column in this dataset used for?",
+])
+def test_technical_questions_are_not_routed(question):
+    assert router.match_rules(question) is None